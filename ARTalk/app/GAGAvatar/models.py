@@ -37,7 +37,7 @@ class GAGAvatar(nn.Module):
         _water_mark_path = os.path.join(_abs_path, '../../assets/GAGAvatar/gagavatar_logo.png')
         assert os.path.exists(_model_path), f"Model not found: {_model_path}."
         assert os.path.exists(_tracked_id_path), f"Tracked id not found: {_tracked_id_path}."
-        ckpt = torch.load(_model_path, map_location='cpu', weights_only=True)['model']
+        ckpt = torch.load(_model_path, map_location='cpu', mmap=True, weights_only=True)['model']
         ckpt = {k:v for k, v in ckpt.items() if 'percep_loss' not in k}
         self.load_state_dict(ckpt)
         self.eval()
@@ -21,7 +21,7 @@ class ARTAvatarInferEngine:
         self.fix_pose = fix_pose
         self.clip_length = clip_length
         audio_encoder = 'wav2vec'
-        ckpt = torch.load('./assets/ARTalk_{}.pt'.format(audio_encoder), map_location='cpu', weights_only=True)
+        ckpt = torch.load('./assets/ARTalk_{}.pt'.format(audio_encoder), map_location='cpu', mmap=True, weights_only=True)
         configs = json.load(open("./assets/config.json"))
         configs['AR_CONFIG']['AUDIO_ENCODER'] = audio_encoder
         self.ARTalk = BitwiseARModel(configs).eval().to(device)
@@ -40,7 +40,7 @@ class ARTAvatarInferEngine:
 
     def set_style_motion(self, style_motion):
         if isinstance(style_motion, str):
-            style_motion = torch.load('assets/style_motion/{}.pt'.format(style_motion), map_location='cpu', weights_only=True)
+            style_motion = torch.load('assets/style_motion/{}.pt'.format(style_motion), map_location='cpu', mmap=True, weights_only=True)
         assert style_motion.shape == (50, 106), f'Invalid style_motion shape: {style_motion.shape}.'
         self.style_motion = style_motion[None].to(self.device)
 
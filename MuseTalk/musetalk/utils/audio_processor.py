@@ -3,19 +3,38 @@ import os
 
 import librosa
 import numpy as np
+import soundfile as sf
 import torch
 from einops import rearrange
 from transformers import AutoFeatureExtractor
 
 
+# Containers libsndfile decodes natively; anything else goes through librosa's audioread/ffmpeg path
+SOUNDFILE_EXTENSIONS = {".wav", ".flac"}
+
+
+def load_audio(wav_path, sr=16000):
+    """Load audio as mono float32 at sr, reading WAV/FLAC directly instead of via an ffmpeg decode"""
+    if os.path.splitext(wav_path)[1].lower() not in SOUNDFILE_EXTENSIONS:
+        return librosa.load(wav_path, sr=sr)
+
+    data, sampling_rate = sf.read(wav_path, dtype="float32", always_2d=True)
+    data = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    if sampling_rate != sr:
+        data = librosa.resample(data, orig_sr=sampling_rate, target_sr=sr)
+    return np.ascontiguousarray(data, dtype=np.float32), sr
+
+
 class AudioProcessor:
     def __init__(self, feature_extractor_path="openai/whisper-tiny/"):
         self.feature_extractor = AutoFeatureExtractor.from_pretrained(feature_extractor_path)
+        self._mel_filters = None
+        self._window = None
 
     def get_audio_feature(self, wav_path, start_index=0, weight_dtype=None):
         if not os.path.exists(wav_path):
             return None
-        librosa_output, sampling_rate = librosa.load(wav_path, sr=16000)
+        librosa_output, sampling_rate = load_audio(wav_path)
         assert sampling_rate == 16000
         # Split audio into 30s segments
         segment_length = 30 * sampling_rate
@@ -34,6 +53,41 @@ class AudioProcessor:
 
         return features, len(librosa_output)
 
+    def get_audio_feature_gpu(self, wav_path, device, weight_dtype=None):
+        """Same log-mel features as get_audio_feature, but the STFT and mel projection run on device"""
+        if not os.path.exists(wav_path):
+            return None
+        librosa_output, sampling_rate = load_audio(wav_path)
+        assert sampling_rate == 16000
+
+        fe = self.feature_extractor
+        if self._mel_filters is None or self._mel_filters.device != torch.device(device):
+            self._mel_filters = torch.from_numpy(fe.mel_filters).to(device=device, dtype=torch.float32)
+            self._window = torch.hann_window(fe.n_fft, device=device)
+
+        # One host-to-device copy for the whole waveform, then everything stays on the GPU
+        wav = torch.from_numpy(librosa_output).to(device)
+        segment_length = 30 * sampling_rate
+
+        # All 30s windows go through one batched STFT: zero-pad the waveform to whole windows and stack them
+        num_segments = max(1, -(-wav.shape[0] // segment_length))
+        segments = torch.nn.functional.pad(wav, (0, num_segments * segment_length - wav.shape[0]))
+        segments = segments.view(num_segments, segment_length)
+        if fe.n_samples != segment_length:
+            segments = torch.nn.functional.pad(segments, (0, fe.n_samples - segment_length))
+
+        # Mirror WhisperFeatureExtractor: power STFT, mel, log10, per-window dynamic range clamp
+        stft = torch.stft(segments, fe.n_fft, fe.hop_length, window=self._window, return_complex=True)
+        magnitudes = stft[..., :-1].abs() ** 2
+        mel_spec = self._mel_filters.T @ magnitudes
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.amax(dim=(1, 2), keepdim=True) - 8.0)
+        audio_features = (log_spec + 4.0) / 4.0
+        if weight_dtype is not None:
+            audio_features = audio_features.to(dtype=weight_dtype)
+
+        return list(audio_features.split(1)), len(librosa_output)
+
     def get_whisper_chunk(
         self,
         whisper_input_features,
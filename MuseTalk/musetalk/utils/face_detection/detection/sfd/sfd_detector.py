@@ -21,7 +21,10 @@ class SFDDetector(FaceDetector):
         if not os.path.isfile(path_to_detector):
             model_weights = load_url(models_urls['s3fd'])
         else:
-            model_weights = torch.load(path_to_detector)
+            try:
+                model_weights = torch.load(path_to_detector, map_location='cpu', mmap=True, weights_only=True)
+            except (TypeError, RuntimeError):
+                model_weights = torch.load(path_to_detector, map_location='cpu')
 
         self.face_detector = s3fd()
         self.face_detector.load_state_dict(model_weights)
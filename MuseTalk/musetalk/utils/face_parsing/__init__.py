@@ -62,9 +62,13 @@ class FaceParsing():
         net = BiSeNet(resnet_path)
         if torch.cuda.is_available():
             net.cuda()
-            net.load_state_dict(torch.load(model_pth)) 
-        else:
-            net.load_state_dict(torch.load(model_pth, map_location=torch.device('cpu')))
+        # mmap lets concurrent workers share the checkpoint through the page cache
+        try:
+            state_dict = torch.load(model_pth, map_location='cpu', mmap=True, weights_only=True)
+        except (TypeError, RuntimeError):
+            # torch < 2.1 has no mmap, and legacy-format checkpoints can't be mapped
+            state_dict = torch.load(model_pth, map_location='cpu')
+        net.load_state_dict(state_dict)
         net.eval()
         return net
 
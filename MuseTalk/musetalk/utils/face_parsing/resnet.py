@@ -80,7 +80,10 @@ class Resnet18(nn.Module):
         return feat8, feat16, feat32
 
     def init_weight(self, model_path):
-        state_dict = torch.load(model_path) #modelzoo.load_url(resnet18_url)
+        try:
+            state_dict = torch.load(model_path, map_location='cpu', mmap=True, weights_only=True)
+        except (TypeError, RuntimeError):
+            state_dict = torch.load(model_path, map_location='cpu') #modelzoo.load_url(resnet18_url)
         self_state_dict = self.state_dict()
         for k, v in state_dict.items():
             if 'fc' in k: continue
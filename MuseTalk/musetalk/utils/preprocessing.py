@@ -11,6 +11,7 @@ from mmpose.apis import inference_topdown, init_model
 from mmpose.structures import merge_data_samples
 import torch
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 # initialize the mmpose model
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -33,11 +34,10 @@ def resize_landmark(landmark, w, h, new_w, new_h):
     return landmark_resized
 
 def read_imgs(img_list):
-    frames = []
     print('reading images...')
-    for img_path in tqdm(img_list):
-        frame = cv2.imread(img_path)
-        frames.append(frame)
+    # cv2.imread releases the GIL, so decoding on a thread pool scales with cores
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        frames = list(tqdm(executor.map(cv2.imread, img_list), total=len(img_list)))
     return frames
 
 def get_bbox_range(img_list,upperbondrange =0):
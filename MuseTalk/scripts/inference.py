@@ -10,17 +10,25 @@ import argparse
 import numpy as np
 import subprocess
 import shlex
+import uuid
 from tqdm import tqdm
 from omegaconf import OmegaConf
 from transformers import WhisperModel
 import sys
+import json
+from types import SimpleNamespace
 
-from musetalk.utils.blending import get_image
+from musetalk.utils.blending import get_image, get_image_prepare_material, get_image_blending
 from musetalk.utils.face_parsing import FaceParsing
 from musetalk.utils.audio_processor import AudioProcessor
 from musetalk.utils.utils import get_file_type, get_video_fps, datagen, load_all_model
 from musetalk.utils.preprocessing import get_landmark_and_bbox, read_imgs, coord_placeholder
 
+# Extra output flags for the frame encode, e.g. "-threads 0 -c:v h264_nvenc -preset p4 -tune ll"
+FFMPEG_EXTRA = shlex.split(os.environ.get("MUSETALK_FFMPEG_EXTRA", ""))
+# Opt-in: CUDA graphs cut the UNet's launch overhead, but every new batch shape recompiles
+COMPILE_UNET = os.environ.get("MUSETALK_COMPILE") == "1"
+
 def fast_check_ffmpeg():
     try:
         subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
@@ -28,17 +36,62 @@ def fast_check_ffmpeg():
     except:
         return False
 
-@torch.no_grad()
-def main(args):
-    # Configure ffmpeg path
-    if not fast_check_ffmpeg():
-        print("Adding ffmpeg to PATH")
-        # Choose path separator based on operating system
-        path_separator = ';' if sys.platform == 'win32' else ':'
-        os.environ["PATH"] = f"{args.ffmpeg_path}{path_separator}{os.environ['PATH']}"
-        if not fast_check_ffmpeg():
-            print("Warning: Unable to find ffmpeg, please ensure ffmpeg is properly installed")
-    
+def load_preprocess_cache(cache_dir):
+    """Load coords, frames, VAE latents and blend masks saved by save_preprocess_cache, or None on a miss"""
+    marker = os.path.join(cache_dir, "preprocess.json")
+    if not os.path.exists(marker):
+        return None
+    with open(marker) as f:
+        meta = json.load(f)
+    # Tensors, arrays and JSON only: nothing in the cache directory is unpickled
+    latents_path = os.path.join(cache_dir, "latents.pt")
+    try:
+        input_latent_list = torch.load(latents_path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:  # torch < 2.1 has no mmap loading
+        input_latent_list = torch.load(latents_path, map_location="cpu", weights_only=True)
+    frames = np.load(os.path.join(cache_dir, "frames.npy"), mmap_mode="r")
+    with np.load(os.path.join(cache_dir, "masks.npz")) as masks:
+        blend_materials = [
+            None if crop_box is None else (masks[f"mask_{i}"], crop_box)
+            for i, crop_box in enumerate(meta["crop_boxes"])
+        ]
+    return {
+        "coord_list": [tuple(bbox) for bbox in meta["coord_list"]],
+        "frame_list": [np.array(frame) for frame in frames],
+        "input_latent_list": input_latent_list,
+        "blend_materials": blend_materials,
+    }
+
+
+def save_preprocess_cache(cache_dir, coord_list, frame_list, input_latent_list, blend_materials):
+    """Persist preprocessing results; preprocess.json is written last and marks the entry complete"""
+    if len({frame.shape for frame in frame_list}) != 1:
+        return  # frames of mixed sizes cannot be stacked into one array
+    os.makedirs(cache_dir, exist_ok=True)
+
+    def write(name, save, mode="wb"):
+        # Write-then-rename so a worker reading the same avatar entry never sees a partial file
+        path = os.path.join(cache_dir, name)
+        partial = f"{path}.{os.getpid()}.part"
+        with open(partial, mode) as f:
+            save(f)
+        os.replace(partial, path)
+
+    write("frames.npy", lambda f: np.save(f, np.stack(frame_list)))
+    write("latents.pt", lambda f: torch.save([latent.cpu() for latent in input_latent_list], f))
+    write("masks.npz", lambda f: np.savez(f, **{
+        f"mask_{i}": material[0] for i, material in enumerate(blend_materials) if material is not None
+    }))
+    write("preprocess.json", lambda f: json.dump({
+        # numpy scalars -> Python int/float, keeping ints as ints for slicing
+        "coord_list": [[np.asarray(v).item() for v in bbox] for bbox in coord_list],
+        "crop_boxes": [None if material is None else [np.asarray(v).item() for v in material[1]]
+                       for material in blend_materials],
+    }, f), mode="w")
+
+
+def load_models(args):
+    """Load the UNet, VAE, positional encoder, Whisper and face parser once"""
     # Set computing device
     device = torch.device(f"cuda:{args.gpu_id}" if torch.cuda.is_available() else "cpu")
     # Load model weights
@@ -60,6 +113,13 @@ def main(args):
     pe = pe.to(device)
     vae.vae = vae.vae.to(device)
     unet.model = unet.model.to(device)
+    
+    # Route the UNet attention through F.scaled_dot_product_attention, which picks flash/memory-efficient kernels when eligible
+    try:
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        unet.model.set_attn_processor(AttnProcessor2_0())
+    except ImportError:
+        pass
         
     # Initialize audio processor and Whisper model
     audio_processor = AudioProcessor(feature_extractor_path=args.whisper_dir)
@@ -68,6 +128,9 @@ def main(args):
     whisper = whisper.to(device=device, dtype=weight_dtype).eval()
     whisper.requires_grad_(False)
     
+    if device.type == "cuda" and COMPILE_UNET and hasattr(torch, "compile"):
+        unet.model = torch.compile(unet.model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+    
     # Initialize face parser with configurable parameters based on version
     if args.version == "v15":
         fp = FaceParsing(
@@ -77,186 +140,381 @@ def main(args):
     else:  # v1
         fp = FaceParsing()
     
-    # Load inference configuration
-    inference_config = OmegaConf.load(args.inference_config)
-    print("Loaded inference config:", inference_config)
+    return SimpleNamespace(device=device, vae=vae, unet=unet, pe=pe, timesteps=timesteps,
+                           audio_processor=audio_processor, whisper=whisper,
+                           weight_dtype=weight_dtype, fp=fp)
+
+
+@torch.no_grad()
+def prepare_task(args, models, task):
+    """Audio features, face coords, latents and blend masks for one video/image + audio pair"""
+    device, vae, unet = models.device, models.vae, models.unet
+    audio_processor, whisper, weight_dtype, fp = models.audio_processor, models.whisper, models.weight_dtype, models.fp
     
-    # Process each task
-    for task_id in inference_config:
-        try:
-            # Get task configuration
-            video_path = inference_config[task_id]["video_path"]
-            audio_path = inference_config[task_id]["audio_path"]
-            if "result_name" in inference_config[task_id]:
-                args.output_vid_name = inference_config[task_id]["result_name"]
-            
-            # Set bbox_shift based on version
+    # Get task configuration
+    video_path = task["video_path"]
+    audio_path = task["audio_path"]
+    if "result_name" in task:
+        args.output_vid_name = task["result_name"]
+
+    # Set bbox_shift based on version
+    if args.version == "v15":
+        bbox_shift = 0  # v15 uses fixed bbox_shift
+    else:
+        bbox_shift = task.get("bbox_shift", args.bbox_shift)  # v1 uses config or default
+
+    # Set output paths
+    input_basename = os.path.basename(video_path).split('.')[0]
+    audio_basename = os.path.basename(audio_path).split('.')[0]
+    output_basename = f"{input_basename}_{audio_basename}"
+
+    # Create temporary directories
+    temp_dir = os.path.join(args.result_dir, f"{args.version}")
+    os.makedirs(temp_dir, exist_ok=True)
+
+    # Set result save paths
+    result_img_save_path = os.path.join(temp_dir, output_basename)
+    if args.saved_coord or args.use_saved_coord:
+        # Shared by name so later runs on the same input can reuse it
+        crop_coord_save_path = os.path.join(args.result_dir, "../", input_basename+".pkl")
+    else:
+        # Throwaway; batched tasks and concurrent workers must not read or remove each other's file
+        crop_coord_save_path = os.path.join(temp_dir, f"{input_basename}.{uuid.uuid4().hex}.pkl")
+    os.makedirs(result_img_save_path, exist_ok=True)
+
+    # Set output video paths
+    if args.output_vid_name is None:
+        output_vid_name = os.path.join(temp_dir, output_basename + ".mp4")
+    else:
+        output_vid_name = os.path.join(temp_dir, args.output_vid_name)
+    output_vid_name_concat = os.path.join(temp_dir, output_basename + "_concat.mp4")
+
+    # Extract frames from source video
+    save_dir_full = None
+    if get_file_type(video_path) == "video":
+        save_dir_full = os.path.join(temp_dir, input_basename)
+        os.makedirs(save_dir_full, exist_ok=True)
+        cmd = [
+            "ffmpeg", "-v", "fatal", "-i", video_path, 
+            "-start_number", "0", f"{save_dir_full}/%08d.png"
+        ]
+        subprocess.run(cmd, check=True)
+        input_img_list = sorted(glob.glob(os.path.join(save_dir_full, '*.[jpJP][pnPN]*[gG]')))
+        fps = get_video_fps(video_path)
+    elif get_file_type(video_path) == "image":
+        input_img_list = [video_path]
+        fps = args.fps
+    elif os.path.isdir(video_path):
+        input_img_list = glob.glob(os.path.join(video_path, '*.[jpJP][pnPN]*[gG]'))
+        input_img_list = sorted(input_img_list, key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
+        fps = args.fps
+    else:
+        raise ValueError(f"{video_path} should be a video file, an image file or a directory of images")
+
+    # Extract audio features
+    if device.type == "cuda":
+        # STFT and mel projection on the GPU, next to the Whisper encoder that consumes them
+        whisper_input_features, librosa_length = audio_processor.get_audio_feature_gpu(audio_path, device)
+    else:
+        whisper_input_features, librosa_length = audio_processor.get_audio_feature(audio_path)
+    whisper_chunks = audio_processor.get_whisper_chunk(
+        whisper_input_features, 
+        device, 
+        weight_dtype, 
+        whisper, 
+        librosa_length,
+        fps=fps,
+        audio_padding_length_left=args.audio_padding_length_left,
+        audio_padding_length_right=args.audio_padding_length_right,
+    )
+
+    # Preprocess input images, or reuse a previous run's results for the same avatar
+    cache = load_preprocess_cache(args.preprocess_cache) if args.preprocess_cache else None
+    if cache is not None:
+        print("Using cached preprocessing")
+        coord_list = cache["coord_list"]
+        frame_list = cache["frame_list"]
+    elif os.path.exists(crop_coord_save_path) and args.use_saved_coord:
+        print("Using saved coordinates")
+        with open(crop_coord_save_path, 'rb') as f:
+            coord_list = pickle.load(f)
+        frame_list = read_imgs(input_img_list)
+    else:
+        print("Extracting landmarks... time-consuming operation")
+        coord_list, frame_list = get_landmark_and_bbox(input_img_list, bbox_shift)
+        with open(crop_coord_save_path, 'wb') as f:
+            pickle.dump(coord_list, f)
+
+    print(f"Number of frames: {len(frame_list)}")         
+
+    # Process each frame
+    if cache is not None:
+        input_latent_list = [latent.to(device=device, dtype=unet.model.dtype) for latent in cache["input_latent_list"]]
+        blend_materials = cache["blend_materials"]
+    else:
+        input_latent_list = []
+        blend_materials = []
+        for bbox, frame in zip(coord_list, frame_list):
+            if bbox == coord_placeholder:
+                blend_materials.append(None)
+                continue
+            x1, y1, x2, y2 = bbox
             if args.version == "v15":
-                bbox_shift = 0  # v15 uses fixed bbox_shift
-            else:
-                bbox_shift = inference_config[task_id].get("bbox_shift", args.bbox_shift)  # v1 uses config or default
-            
-            # Set output paths
-            input_basename = os.path.basename(video_path).split('.')[0]
-            audio_basename = os.path.basename(audio_path).split('.')[0]
-            output_basename = f"{input_basename}_{audio_basename}"
-            
-            # Create temporary directories
-            temp_dir = os.path.join(args.result_dir, f"{args.version}")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Set result save paths
-            result_img_save_path = os.path.join(temp_dir, output_basename)
-            crop_coord_save_path = os.path.join(args.result_dir, "../", input_basename+".pkl")
-            os.makedirs(result_img_save_path, exist_ok=True)
-            
-            # Set output video paths
-            if args.output_vid_name is None:
-                output_vid_name = os.path.join(temp_dir, output_basename + ".mp4")
-            else:
-                output_vid_name = os.path.join(temp_dir, args.output_vid_name)
-            output_vid_name_concat = os.path.join(temp_dir, output_basename + "_concat.mp4")
-            
-            # Extract frames from source video
-            if get_file_type(video_path) == "video":
-                save_dir_full = os.path.join(temp_dir, input_basename)
-                os.makedirs(save_dir_full, exist_ok=True)
-                cmd = [
-                    "ffmpeg", "-v", "fatal", "-i", video_path, 
-                    "-start_number", "0", f"{save_dir_full}/%08d.png"
-                ]
-                subprocess.run(cmd, check=True)
-                input_img_list = sorted(glob.glob(os.path.join(save_dir_full, '*.[jpJP][pnPN]*[gG]')))
-                fps = get_video_fps(video_path)
-            elif get_file_type(video_path) == "image":
-                input_img_list = [video_path]
-                fps = args.fps
-            elif os.path.isdir(video_path):
-                input_img_list = glob.glob(os.path.join(video_path, '*.[jpJP][pnPN]*[gG]'))
-                input_img_list = sorted(input_img_list, key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
-                fps = args.fps
-            else:
-                raise ValueError(f"{video_path} should be a video file, an image file or a directory of images")
-
-            # Extract audio features
-            whisper_input_features, librosa_length = audio_processor.get_audio_feature(audio_path)
-            whisper_chunks = audio_processor.get_whisper_chunk(
-                whisper_input_features, 
-                device, 
-                weight_dtype, 
-                whisper, 
-                librosa_length,
-                fps=fps,
-                audio_padding_length_left=args.audio_padding_length_left,
-                audio_padding_length_right=args.audio_padding_length_right,
-            )
-            
-            # Preprocess input images
-            if os.path.exists(crop_coord_save_path) and args.use_saved_coord:
-                print("Using saved coordinates")
-                with open(crop_coord_save_path, 'rb') as f:
-                    coord_list = pickle.load(f)
-                frame_list = read_imgs(input_img_list)
+                y2 = y2 + args.extra_margin
+                y2 = min(y2, frame.shape[0])
+            crop_frame = frame[y1:y2, x1:x2]
+            crop_frame = cv2.resize(crop_frame, (256,256), interpolation=cv2.INTER_LANCZOS4)
+            latents = vae.get_latents_for_unet(crop_frame)
+            input_latent_list.append(latents)
+            # Face parsing depends only on the source frame, so do it once per frame rather than per output frame
+            if args.version == "v15":
+                blend_materials.append(get_image_prepare_material(frame, [x1, y1, x2, y2], fp=fp, mode=args.parsing_mode))
             else:
-                print("Extracting landmarks... time-consuming operation")
-                coord_list, frame_list = get_landmark_and_bbox(input_img_list, bbox_shift)
-                with open(crop_coord_save_path, 'wb') as f:
-                    pickle.dump(coord_list, f)
-            
-            print(f"Number of frames: {len(frame_list)}")         
-            
-            # Process each frame
-            input_latent_list = []
-            for bbox, frame in zip(coord_list, frame_list):
-                if bbox == coord_placeholder:
-                    continue
-                x1, y1, x2, y2 = bbox
-                if args.version == "v15":
-                    y2 = y2 + args.extra_margin
-                    y2 = min(y2, frame.shape[0])
-                crop_frame = frame[y1:y2, x1:x2]
-                crop_frame = cv2.resize(crop_frame, (256,256), interpolation=cv2.INTER_LANCZOS4)
-                latents = vae.get_latents_for_unet(crop_frame)
-                input_latent_list.append(latents)
+                blend_materials.append(get_image_prepare_material(frame, [x1, y1, x2, y2], fp=fp))
+        if args.preprocess_cache:
+            save_preprocess_cache(args.preprocess_cache, coord_list, frame_list, input_latent_list, blend_materials)
+
+    # Smooth first and last frames
+    frame_list_cycle = frame_list + frame_list[::-1]
+    coord_list_cycle = coord_list + coord_list[::-1]
+    input_latent_list_cycle = input_latent_list + input_latent_list[::-1]
+    blend_materials_cycle = blend_materials + blend_materials[::-1]
+
+    return SimpleNamespace(
+        args=args, fps=fps, fp=fp, audio_path=audio_path, whisper_chunks=whisper_chunks,
+        input_latent_list_cycle=input_latent_list_cycle, coord_list_cycle=coord_list_cycle,
+        frame_list_cycle=frame_list_cycle, blend_materials_cycle=blend_materials_cycle,
+        temp_dir=temp_dir, input_basename=input_basename, audio_basename=audio_basename,
+        result_img_save_path=result_img_save_path, crop_coord_save_path=crop_coord_save_path,
+        save_dir_full=save_dir_full, output_vid_name=output_vid_name,
+    )
+
+
+@torch.no_grad()
+def infer_tasks(models, states):
+    """Run the UNet and VAE decode for several prepared tasks, packing their frames into shared batches"""
+    device, vae, unet, pe, timesteps = models.device, models.vae, models.unet, models.pe, models.timesteps
+    
+    print("Starting inference")
+    gens = [datagen(
+        whisper_chunks=state.whisper_chunks,
+        vae_encode_latents=state.input_latent_list_cycle,
+        batch_size=state.args.batch_size,
+        delay_frame=0,
+        device=device,
+    ) for state in states]
+    res_frame_lists = [[] for _ in states]
+    total = max(int(np.ceil(float(len(state.whisper_chunks)) / state.args.batch_size)) for state in states)
+    
+    # Each step takes the next batch from every unfinished task and runs them as one forward
+    active = list(range(len(states)))
+    for _ in tqdm(range(total)):
+        pieces = []
+        for idx in list(active):
+            try:
+                pieces.append((idx, *next(gens[idx])))
+            except StopIteration:
+                active.remove(idx)
+        if not pieces:
+            break
         
-            # Smooth first and last frames
-            frame_list_cycle = frame_list + frame_list[::-1]
-            coord_list_cycle = coord_list + coord_list[::-1]
-            input_latent_list_cycle = input_latent_list + input_latent_list[::-1]
-            
-            # Batch inference
-            print("Starting inference")
-            video_num = len(whisper_chunks)
-            batch_size = args.batch_size
-            gen = datagen(
-                whisper_chunks=whisper_chunks,
-                vae_encode_latents=input_latent_list_cycle,
-                batch_size=batch_size,
-                delay_frame=0,
-                device=device,
-            )
-            
-            res_frame_list = []
-            total = int(np.ceil(float(video_num) / batch_size))
-            
-            # Execute inference
-            for i, (whisper_batch, latent_batch) in enumerate(tqdm(gen, total=total)):
-                audio_feature_batch = pe(whisper_batch)
-                latent_batch = latent_batch.to(dtype=unet.model.dtype)
-                
-                pred_latents = unet.model(latent_batch, timesteps, encoder_hidden_states=audio_feature_batch).sample
-                recon = vae.decode_latents(pred_latents)
-                for res_frame in recon:
-                    res_frame_list.append(res_frame)
-            
-            # Pad generated images to original video size
-            print("Padding generated images to original video size")
-            for i, res_frame in enumerate(tqdm(res_frame_list)):
-                bbox = coord_list_cycle[i%(len(coord_list_cycle))]
-                ori_frame = copy.deepcopy(frame_list_cycle[i%(len(frame_list_cycle))])
-                x1, y1, x2, y2 = bbox
-                if args.version == "v15":
-                    y2 = y2 + args.extra_margin
-                    y2 = min(y2, frame.shape[0])
-                try:
-                    res_frame = cv2.resize(res_frame.astype(np.uint8), (x2-x1, y2-y1))
-                except:
-                    continue
-                
-                # Merge results with version-specific parameters
-                if args.version == "v15":
-                    combine_frame = get_image(ori_frame, res_frame, [x1, y1, x2, y2], mode=args.parsing_mode, fp=fp)
-                else:
-                    combine_frame = get_image(ori_frame, res_frame, [x1, y1, x2, y2], fp=fp)
-                cv2.imwrite(f"{result_img_save_path}/{str(i).zfill(8)}.png", combine_frame)
-
-            # Save prediction results
-            temp_vid_path = f"{temp_dir}/temp_{input_basename}_{audio_basename}.mp4"
-            cmd_img2video = [
-                "ffmpeg", "-y", "-v", "warning", "-r", str(fps), 
-                "-f", "image2", "-i", f"{result_img_save_path}/%08d.png",
-                "-vcodec", "libx264", "-vf", "format=yuv420p", 
-                "-crf", "18", temp_vid_path
-            ]
-            print("Video generation command:", ' '.join(cmd_img2video))
-            subprocess.run(cmd_img2video, check=True)   
-            
-            cmd_combine_audio = [
-                "ffmpeg", "-y", "-v", "warning", 
-                "-i", audio_path, "-i", temp_vid_path, output_vid_name
+        whisper_batch = torch.cat([whisper for _, whisper, _ in pieces]).to(device)
+        latent_batch = torch.cat([latent for _, _, latent in pieces]).to(device=device, dtype=unet.model.dtype)
+        audio_feature_batch = pe(whisper_batch)
+        
+        pred_latents = unet.model(latent_batch, timesteps, encoder_hidden_states=audio_feature_batch).sample
+        recon = vae.decode_latents(pred_latents)
+        
+        start = 0
+        for idx, whisper, _ in pieces:
+            res_frame_lists[idx].extend(recon[start:start + whisper.shape[0]])
+            start += whisper.shape[0]
+    
+    return res_frame_lists
+
+
+def finish_task(state, res_frame_list):
+    """Blend generated faces back into the frames, encode the video with audio, and clean up"""
+    args, fps, fp, audio_path = state.args, state.fps, state.fp, state.audio_path
+    coord_list_cycle, frame_list_cycle = state.coord_list_cycle, state.frame_list_cycle
+    blend_materials_cycle = state.blend_materials_cycle
+    temp_dir, input_basename, audio_basename = state.temp_dir, state.input_basename, state.audio_basename
+    result_img_save_path, crop_coord_save_path = state.result_img_save_path, state.crop_coord_save_path
+    save_dir_full, output_vid_name = state.save_dir_full, state.output_vid_name
+
+    # Pad generated images to original video size
+    print("Padding generated images to original video size")
+    for i, res_frame in enumerate(tqdm(res_frame_list)):
+        bbox = coord_list_cycle[i%(len(coord_list_cycle))]
+        ori_frame = copy.deepcopy(frame_list_cycle[i%(len(frame_list_cycle))])
+        x1, y1, x2, y2 = bbox
+        if args.version == "v15":
+            y2 = y2 + args.extra_margin
+            y2 = min(y2, ori_frame.shape[0])
+        try:
+            res_frame = cv2.resize(res_frame.astype(np.uint8), (x2-x1, y2-y1))
+        except:
+            continue
+
+        # Merge results using the per-frame mask and crop box prepared above
+        material = blend_materials_cycle[i%(len(blend_materials_cycle))]
+        if material is not None:
+            mask, crop_box = material
+            combine_frame = get_image_blending(ori_frame, res_frame, [x1, y1, x2, y2], mask, crop_box)
+        elif args.version == "v15":
+            combine_frame = get_image(ori_frame, res_frame, [x1, y1, x2, y2], mode=args.parsing_mode, fp=fp)
+        else:
+            combine_frame = get_image(ori_frame, res_frame, [x1, y1, x2, y2], fp=fp)
+        cv2.imwrite(f"{result_img_save_path}/{str(i).zfill(8)}.png", combine_frame)
+
+    # Save prediction results
+    temp_vid_path = f"{temp_dir}/temp_{input_basename}_{audio_basename}.mp4"
+    cmd_img2video = [
+        "ffmpeg", "-y", "-v", "warning", "-r", str(fps), 
+        "-f", "image2", "-i", f"{result_img_save_path}/%08d.png",
+        "-vcodec", "libx264", "-vf", "format=yuv420p", 
+        "-crf", "18", *FFMPEG_EXTRA, temp_vid_path
+    ]
+    print("Video generation command:", ' '.join(cmd_img2video))
+    subprocess.run(cmd_img2video, check=True)   
+
+    # Fragmented MP4 needs no seek back to write the index, so it can go to a pipe and play while written
+    fragmented = ["-movflags", "frag_keyframe+empty_moov", "-f", "mp4"] if args.fragmented else []
+    cmd_combine_audio = [
+        "ffmpeg", "-y", "-v", "warning", 
+        "-i", audio_path, "-i", temp_vid_path,
+        # The video was just encoded; only the audio needs encoding here
+        "-c:v", "copy", *fragmented, output_vid_name
+    ]
+    print("Audio combination command:", ' '.join(cmd_combine_audio))
+    subprocess.run(cmd_combine_audio, check=True)
+
+    # Clean up temporary files
+    shutil.rmtree(result_img_save_path)
+    os.remove(temp_vid_path)
+
+    if save_dir_full is not None:
+        shutil.rmtree(save_dir_full)
+    if not args.saved_coord and os.path.exists(crop_coord_save_path):
+        os.remove(crop_coord_save_path)
+
+    print(f"Results saved to {output_vid_name}")
+    return output_vid_name
+
+
+def run_task(args, models, task):
+    """Lip-sync one video/image + audio pair and return the output video path"""
+    state = prepare_task(args, models, task)
+    return finish_task(state, infer_tasks(models, [state])[0])
+
+
+def run_tasks(args_list, models, tasks):
+    """Lip-sync several pairs with shared UNet batches; returns a path or an exception per task"""
+    states, results = [], []
+    for args, task in zip(args_list, tasks):
+        try:
+            states.append(prepare_task(args, models, task))
+            results.append(None)
+        except Exception as e:
+            results.append(e)
+    
+    if states:
+        res_frame_lists = iter(infer_tasks(models, states))
+        states = iter(states)
+        for i, result in enumerate(results):
+            if result is not None:
+                continue
+            try:
+                results[i] = finish_task(next(states), next(res_frame_lists))
+            except Exception as e:
+                results[i] = e
+    return results
+
+
+def serve(args, models):
+    """Answer one JSON job per stdin line with one JSON result per stdout line, keeping models loaded"""
+    # Inference prints progress; keep stdout for the protocol only
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def reply(message):
+        protocol_out.write(json.dumps(message) + "\n")
+        protocol_out.flush()
+
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            # A batch job carries several tasks whose frames share UNet forwards
+            tasks = job["batch"] if "batch" in job else [job]
+            args_list = []
+            for task in tasks:
+                # Per-task overrides of the command-line defaults (result_dir, output_vid_name, preprocess_cache, ...)
+                task_args = copy.copy(args)
+                for key, value in task.get("options", {}).items():
+                    setattr(task_args, key, value)
+                args_list.append(task_args)
+            results = run_tasks(args_list, models, [
+                {"video_path": task["video_path"], "audio_path": task["audio_path"], "bbox_shift": task_args.bbox_shift}
+                for task, task_args in zip(tasks, args_list)
+            ])
+            results = [
+                {"success": False, "error": str(result)} if isinstance(result, Exception)
+                else {"success": True, "video_path": result}
+                for result in results
             ]
-            print("Audio combination command:", ' '.join(cmd_combine_audio))
-            subprocess.run(cmd_combine_audio, check=True)
-            
-            # Clean up temporary files
-            shutil.rmtree(result_img_save_path)
-            os.remove(temp_vid_path)
-            
-            shutil.rmtree(save_dir_full)
-            if not args.saved_coord:
-                os.remove(crop_coord_save_path)
-                    
-            print(f"Results saved to {output_vid_name}")
+            if "batch" in job:
+                reply({"id": job_id, "success": True, "results": results})
+            else:
+                reply({"id": job_id, **results[0]})
+        except Exception as e:
+            reply({"id": job_id, "success": False, "error": str(e)})
+        finally:
+            # Release per-job activations so long-lived workers don't accumulate cached blocks
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+
+def main(args):
+    # Configure ffmpeg path
+    if not fast_check_ffmpeg():
+        print("Adding ffmpeg to PATH")
+        # Choose path separator based on operating system
+        path_separator = ';' if sys.platform == 'win32' else ':'
+        os.environ["PATH"] = f"{args.ffmpeg_path}{path_separator}{os.environ['PATH']}"
+        if not fast_check_ffmpeg():
+            print("Warning: Unable to find ffmpeg, please ensure ffmpeg is properly installed")
+    
+    models = load_models(args)
+    
+    if args.serve:
+        serve(args, models)
+        return
+    
+    # Load inference configuration, or build a single task from the command line
+    if args.video_path and args.audio_path:
+        inference_config = {
+            "task_0": {
+                "video_path": args.video_path,
+                "audio_path": args.audio_path,
+                "bbox_shift": args.bbox_shift
+            }
+        }
+    else:
+        inference_config = OmegaConf.load(args.inference_config)
+    print("Loaded inference config:", inference_config)
+    
+    # Process each task
+    for task_id in inference_config:
+        try:
+            run_task(args, models, inference_config[task_id])
         except Exception as e:
             print("Error occurred during processing:", e)
 
@@ -269,6 +527,9 @@ if __name__ == "__main__":
     parser.add_argument("--unet_model_path", type=str, default="./models/musetalkV15/unet.pth", help="Path to UNet model weights")
     parser.add_argument("--whisper_dir", type=str, default="./models/whisper", help="Directory containing Whisper model")
     parser.add_argument("--inference_config", type=str, default="configs/inference/test_img.yaml", help="Path to inference configuration file")
+    parser.add_argument("--video_path", type=str, default=None, help="Single-task video/image path (skips the inference config)")
+    parser.add_argument("--audio_path", type=str, default=None, help="Single-task audio path (skips the inference config)")
+    parser.add_argument("--preprocess_cache", type=str, default=None, help="Directory to load/save face coords, latents and blend masks for the avatar")
     parser.add_argument("--bbox_shift", type=int, default=0, help="Bounding box shift value")
     parser.add_argument("--result_dir", default='./results', help="Directory for output results")
     parser.add_argument("--extra_margin", type=int, default=10, help="Extra margin for face cropping")
@@ -277,12 +538,14 @@ if __name__ == "__main__":
     parser.add_argument("--audio_padding_length_right", type=int, default=2, help="Right padding length for audio")
     parser.add_argument("--batch_size", type=int, default=8, help="Batch size for inference")
     parser.add_argument("--output_vid_name", type=str, default=None, help="Name of output video file")
+    parser.add_argument("--fragmented", action="store_true", help="Write fragmented MP4 so the output can be a FIFO")
     parser.add_argument("--use_saved_coord", action="store_true", help='Use saved coordinates to save time')
     parser.add_argument("--saved_coord", action="store_true", help='Save coordinates for future use')
     parser.add_argument("--use_float16", action="store_true", help="Use float16 for faster inference")
     parser.add_argument("--parsing_mode", default='jaw', help="Face blending parsing mode")
     parser.add_argument("--left_cheek_width", type=int, default=90, help="Width of left cheek region")
     parser.add_argument("--right_cheek_width", type=int, default=90, help="Width of right cheek region")
+    parser.add_argument("--serve", action="store_true", help="Load models once and run jobs read as JSON lines from stdin")
     parser.add_argument("--version", type=str, default="v15", choices=["v1", "v15"], help="Model version to use")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Bark TTS generation for rap battle characters
+Loads the Bark models once per process and serves synthesis requests either
+from the command line (single job) or as a long-lived stdin/stdout worker
+"""
+import os
+import sys
+import re
+import json
+import argparse
+
+# Small checkpoints are the only practical choice on CPU; bark reads this at import
+os.environ.setdefault("SUNO_USE_SMALL_MODELS", "1")
+
+DEFAULT_VOICE = "v2/en_speaker_6"
+DEFAULT_TEMPERATURE = 0.7
+# Stop semantic generation as soon as EOS becomes plausible instead of running to max length
+MIN_EOS_P = 0.05
+# Bark degrades past ~13s of speech per generation; streamed text is cut into pieces about this long
+MAX_CHUNK_CHARS = 200
+
+
+def split_text(text: str, max_chars: int = MAX_CHUNK_CHARS) -> list:
+    """Split verse text on line and sentence breaks, packing pieces up to max_chars"""
+    pieces = [p.strip() for p in re.split(r"\n+|(?<=[.!?])\s+", text) if p.strip()]
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def _check_thread_config():
+    """Warn when the BLAS pool size disagrees with torch's intra-op thread count"""
+    import torch
+
+    mkl_threads = os.environ.get("MKL_NUM_THREADS")
+    if mkl_threads and mkl_threads.isdigit() and int(mkl_threads) != torch.get_num_threads():
+        print(f"⚠️ MKL_NUM_THREADS={mkl_threads} but torch uses {torch.get_num_threads()} threads - "
+              f"launch through run_bark.sh so thread settings apply before import", file=sys.stderr)
+        print(torch.__config__.parallel_info(), file=sys.stderr)
+
+
+class BarkGenerator:
+    """Keeps the Bark text/coarse/fine/codec models resident between requests"""
+
+    def __init__(self, use_small_models: bool = os.environ.get("SUNO_USE_SMALL_MODELS") == "1"):
+        from bark import SAMPLE_RATE
+        from bark.generation import preload_models
+
+        _check_thread_config()
+
+        # Loading the checkpoints dominates a cold call, so do it exactly once
+        preload_models(
+            text_use_small=use_small_models,
+            coarse_use_small=use_small_models,
+            fine_use_small=use_small_models
+        )
+        self.sample_rate = SAMPLE_RATE
+
+    def generate(self, text: str, output_path: str, voice: str = DEFAULT_VOICE,
+                 temperature: float = DEFAULT_TEMPERATURE) -> str:
+        """Synthesize text to a WAV file and return its path"""
+        from bark.api import semantic_to_waveform
+        from bark.generation import generate_text_semantic
+        from scipy.io.wavfile import write as write_wav
+
+        # KV caching keeps semantic decoding linear in sequence length
+        semantic_tokens = generate_text_semantic(
+            text,
+            history_prompt=voice,
+            temp=temperature,
+            min_eos_p=MIN_EOS_P,
+            use_kv_caching=True,
+            silent=True
+        )
+        audio = semantic_to_waveform(
+            semantic_tokens,
+            history_prompt=voice,
+            temp=temperature,
+            silent=True
+        )
+        write_wav(output_path, self.sample_rate, audio)
+        return output_path
+
+    def generate_chunks(self, text: str, output_dir: str, voice: str = DEFAULT_VOICE,
+                        temperature: float = DEFAULT_TEMPERATURE):
+        """Synthesize text piece by piece, yielding each WAV path as soon as it is written"""
+        os.makedirs(output_dir, exist_ok=True)
+        for i, chunk in enumerate(split_text(text)):
+            yield self.generate(chunk, os.path.join(output_dir, f"chunk_{i:03d}.wav"),
+                                voice=voice, temperature=temperature)
+
+
+def serve(generator: BarkGenerator):
+    """Answer one JSON job per stdin line with one JSON result per stdout line"""
+    # Bark and its dependencies print progress chatter; keep stdout for the protocol only
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def reply(message):
+        protocol_out.write(json.dumps(message) + "\n")
+        protocol_out.flush()
+
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            if job.get("stream"):
+                # One reply per finished piece so the caller can start lip sync before the verse is done
+                count = 0
+                for count, audio_path in enumerate(generator.generate_chunks(
+                        job["text"],
+                        job["output_dir"],
+                        voice=job.get("voice", DEFAULT_VOICE),
+                        temperature=float(job.get("temperature", DEFAULT_TEMPERATURE))), 1):
+                    reply({"id": job_id, "chunk": count - 1, "audio_path": audio_path})
+                reply({"id": job_id, "success": True, "done": True, "chunks": count})
+                continue
+            audio_path = generator.generate(
+                job["text"],
+                job["output_path"],
+                voice=job.get("voice", DEFAULT_VOICE),
+                temperature=float(job.get("temperature", DEFAULT_TEMPERATURE))
+            )
+            reply({"id": job_id, "success": True, "audio_path": audio_path})
+        except Exception as e:
+            reply({"id": job_id, "success": False, "error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bark TTS generation")
+    parser.add_argument("text", nargs="?", help="Text to synthesize")
+    parser.add_argument("output_path", nargs="?", help="Output WAV path")
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help="Bark history prompt")
+    parser.add_argument("--temp", type=float, default=DEFAULT_TEMPERATURE, help="Generation temperature")
+    parser.add_argument("--serve", action="store_true", help="Run as a persistent stdin/stdout JSON worker")
+
+    args = parser.parse_args()
+
+    if not args.serve and not (args.text and args.output_path):
+        parser.error("text and output_path are required unless --serve is given")
+
+    generator = BarkGenerator()
+
+    if args.serve:
+        serve(generator)
+        return 0
+
+    generator.generate(args.text, args.output_path, voice=args.voice, temperature=args.temp)
+    print(f"✅ Bark audio saved to: {args.output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Shared Bark TTS service
+Loads every Bark submodel once in a long-lived process and serves generation
+requests over a local socket, so scripts don't each pay the weight load.
+
+Start it with `python3 bark_service.py`, then call `bark_service.generate(...)`.
+"""
+import os
+import contextlib
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+ADDRESS = ("127.0.0.1", int(os.environ.get("BARK_SERVICE_PORT", "6001")))
+# Requests are pickled, so the key is all that stands between local users and code execution in the
+# service: without BARK_SERVICE_AUTHKEY a random key is generated per run and shared through a 0600 file
+KEY_FILE = os.environ.get("BARK_SERVICE_KEY_FILE", os.path.expanduser("~/.bark_service.key"))
+# bark.SAMPLE_RATE, duplicated so clients don't have to import bark
+SAMPLE_RATE = 24_000
+# The service runs on small CPU hosts; keep intra-op threads from oversubscribing
+SERVICE_THREADS = 2
+PRECISIONS = ("auto", "fp16", "int8", "fp32")
+PRECISION = os.environ.get("BARK_PRECISION", "auto")
+# Opt-in: the first generation pays the compile time
+COMPILE = os.environ.get("BARK_COMPILE") == "1"
+GPT_MODEL_KEYS = ("text", "coarse", "fine")
+
+
+def _read_authkey():
+    """Key the running service accepts: the environment override or the key file it wrote"""
+    if os.environ.get("BARK_SERVICE_AUTHKEY"):
+        return os.environ["BARK_SERVICE_AUTHKEY"].encode()
+    try:
+        with open(KEY_FILE, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise RuntimeError(f"Bark service key not found at {KEY_FILE} - is `python3 bark_service.py` running?")
+
+
+def _create_authkey():
+    """Use the environment override, or generate a fresh key readable only by this user"""
+    if os.environ.get("BARK_SERVICE_AUTHKEY"):
+        return os.environ["BARK_SERVICE_AUTHKEY"].encode()
+    authkey = os.urandom(32)
+    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        # The mode above only applies when the file is created
+        os.fchmod(f.fileno(), 0o600)
+        f.write(authkey)
+    return authkey
+
+
+def _request(message):
+    with Client(ADDRESS, authkey=_read_authkey()) as conn:
+        conn.send(message)
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def generate(text, history_prompt=None, text_temp=0.7, waveform_temp=0.7):
+    """Generate speech on the running service and return it as a float32 array at SAMPLE_RATE"""
+    return _request({
+        "command": "generate",
+        "text": text,
+        "history_prompt": history_prompt,
+        "text_temp": text_temp,
+        "waveform_temp": waveform_temp
+    })["audio"]
+
+
+def status():
+    """Device and library versions of the running service"""
+    return _request({"command": "status"})
+
+
+def _map_gpt_models(transform, model_keys=GPT_MODEL_KEYS):
+    """Replace Bark's loaded text/coarse/fine GPT models with transform(model)"""
+    from bark.generation import models as bark_models
+
+    for model_key in model_keys:
+        entry = bark_models.get(model_key)
+        if entry is None:
+            continue
+        # The text entry bundles the model with its tokenizer
+        if isinstance(entry, dict):
+            entry["model"] = transform(entry["model"])
+        else:
+            bark_models[model_key] = transform(entry)
+
+
+def _optimize_models(torch, use_gpu):
+    """Lower the GPT weights' precision for the device and return the precision in use"""
+    precision = PRECISION
+    if precision not in PRECISIONS:
+        print(f"⚠️ Unsupported BARK_PRECISION={precision!r} (expected one of {', '.join(PRECISIONS)}), using fp32")
+        precision = "fp32"
+    if precision == "auto":
+        if not use_gpu:
+            precision = "int8"
+        elif torch.cuda.is_bf16_supported():
+            # Bark already autocasts to bf16 on these GPUs
+            precision = "bf16"
+        else:
+            # Otherwise Bark would run the GPTs in FP32
+            precision = "fp16"
+
+    if precision == "fp16" and use_gpu:
+        # Half the weight traffic for the memory-bound decode loops; the codec stays FP32
+        _map_gpt_models(lambda model: model.half())
+    elif precision == "int8":
+        if use_gpu:
+            print("⚠️ INT8 dynamic quantization is CPU-only, keeping GPU weights as loaded")
+            precision = "fp32"
+        else:
+            _map_gpt_models(lambda model: torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8))
+    elif precision == "fp16":
+        precision = "fp32"
+
+    # Only the fine model sees a fixed input shape; text/coarse grow every step and would recompile
+    if COMPILE and hasattr(torch, "compile"):
+        _map_gpt_models(lambda model: torch.compile(
+            model, mode="reduce-overhead" if use_gpu else "default", dynamic=False), ("fine",))
+
+    return precision
+
+
+def serve():
+    """Preload Bark and answer requests until interrupted"""
+    # Thread pools are sized when torch is first imported
+    os.environ.setdefault("OMP_NUM_THREADS", str(SERVICE_THREADS))
+
+    import numpy as np
+    import torch
+    from bark import generate_audio
+    from bark.generation import preload_models
+
+    torch.set_num_threads(SERVICE_THREADS)
+    use_gpu = torch.cuda.is_available()
+
+    print("🐶 Loading Bark models...")
+    preload_models(
+        text_use_gpu=use_gpu,
+        coarse_use_gpu=use_gpu,
+        fine_use_gpu=use_gpu,
+        codec_use_gpu=use_gpu
+    )
+    precision = _optimize_models(torch, use_gpu)
+    amp = (torch.autocast("cuda", dtype=torch.float16) if precision == "fp16"
+           else contextlib.nullcontext())
+
+    service_status = {
+        "device": torch.cuda.get_device_name(0) if use_gpu else "cpu",
+        "cuda": use_gpu,
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "sample_rate": SAMPLE_RATE,
+        "precision": precision
+    }
+
+    with Listener(ADDRESS, authkey=_create_authkey()) as listener:
+        print(f"✅ Bark service ready on {ADDRESS[0]}:{ADDRESS[1]} ({service_status['device']}, {precision})")
+        while True:
+            try:
+                conn = listener.accept()
+                request = conn.recv()
+            except (EOFError, OSError, AuthenticationError):
+                continue  # client gave up or failed authentication
+
+            with conn:
+                try:
+                    if request["command"] == "status":
+                        reply = service_status
+                    else:
+                        with amp:
+                            audio = generate_audio(
+                                request["text"],
+                                history_prompt=request.get("history_prompt"),
+                                text_temp=request.get("text_temp", 0.7),
+                                waveform_temp=request.get("waveform_temp", 0.7),
+                                silent=True
+                            )
+                        reply = {"audio": np.asarray(audio, dtype=np.float32)}
+                except Exception as e:
+                    reply = {"error": str(e)}
+                finally:
+                    if use_gpu:
+                        torch.cuda.empty_cache()
+
+                try:
+                    conn.send(reply)
+                except OSError:
+                    pass  # client disconnected while waiting
+
+
+if __name__ == "__main__":
+    try:
+        serve()
+    except KeyboardInterrupt:
+        pass
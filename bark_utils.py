@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the Bark test scripts
+"""
+import numpy as np
+
+from bark_service import SAMPLE_RATE
+
+
+def save_wav(path, audio, sr=SAMPLE_RATE):
+    """Write float audio as 16-bit PCM; a .flac path gets lossless FLAC instead of WAV"""
+    import soundfile as sf
+
+    # Bark can overshoot [-1, 1] slightly, which would wrap around in int16
+    sf.write(path, np.clip(audio, -1.0, 1.0), sr, subtype="PCM_16")
+    return path
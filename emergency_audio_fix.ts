@@ -32,9 +32,6 @@ export class EmergencyAudioService {
       
       const { stdout, stderr } = await exec(
         `export LD_LIBRARY_PATH="/nix/store/*/lib:$LD_LIBRARY_PATH" && timeout 15 python3 -c "
-import os, sys
-os.chdir('/tmp')
-sys.path.insert(0, '/home/runner/workspace/bark')
 import torch
 torch.set_num_threads(1)
 from bark import generate_audio, SAMPLE_RATE
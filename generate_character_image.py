@@ -4,83 +4,161 @@ Generate a new photorealistic portrait for MC Silk using internal AI image gener
 """
 
 import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def generate_mc_silk_portrait():
-    """Generate a new photorealistic portrait for MC Silk"""
-    
-    # Enhanced prompt for MC Silk - black male rapper
-    prompt = """
-    Photorealistic portrait of a confident black male rap battle artist, MC Silk. 
-    Professional studio lighting, sharp focus, high detail. 
+# DALL-E 3 only returns one image per request, so variants are fanned out in parallel
+MAX_WORKERS = 8
+# Spacing between request submissions to stay under the images rate limit
+REQUEST_INTERVAL = 0.2
+
+# One pooled session so repeat calls to the API and image CDN reuse TLS connections
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Generation settings; also part of the cache key so changing them forces regeneration
+IMAGE_PARAMS = {
+    "model": "dall-e-3",
+    "size": "1024x1024",
+    "quality": "hd",
+    "style": "vivid"
+}
+CACHE_DIR = Path("attached_assets/.cache")
+
+# Enhanced prompt for MC Silk - black male rapper
+MC_SILK_PROMPT = """
+    Photorealistic portrait of a confident black male rap battle artist, MC Silk.
+    Professional studio lighting, sharp focus, high detail.
     Age 25-30, strong jawline, intense focused eyes, short styled hair or fade cut.
     Wearing modern streetwear - gold chain, fitted cap or beanie, urban style.
     Confident, smooth expression showing intelligence and lyrical skill.
     Background should be dark/neutral to focus on the face.
     Style: Professional headshot, cinematic lighting, 4K quality.
     """
-    
+
+def _generate_image(prompt, filepath, api_key):
+    """Generate one DALL-E 3 image and stream it to filepath"""
     try:
-        # Check if OpenAI API key is available
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            print("No OpenAI API key found - cannot generate image")
-            return None
-            
-        # Use DALL-E 3 for high-quality generation
-        response = requests.post(
+        response = SESSION.post(
             "https://api.openai.com/v1/images/generations",
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             },
             json={
-                "model": "dall-e-3",
+                **IMAGE_PARAMS,
                 "prompt": prompt,
-                "n": 1,
-                "size": "1024x1024",
-                "quality": "hd",
-                "style": "vivid"
+                "n": 1
             }
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            image_url = result['data'][0]['url']
-            
-            # Download the image
-            img_response = requests.get(image_url)
-            if img_response.status_code == 200:
-                # Save to attached_assets with unique name
-                timestamp = int(datetime.now().timestamp())
-                filename = f"MC_Silk_new_portrait_{timestamp}.png"
-                filepath = f"attached_assets/{filename}"
-                
-                with open(filepath, 'wb') as f:
-                    f.write(img_response.content)
-                
-                print(f"✅ Generated new MC Silk portrait: {filename}")
-                print(f"📁 Saved to: {filepath}")
-                return filename
-            else:
-                print(f"❌ Failed to download image: {img_response.status_code}")
-                return None
-        else:
+
+        if response.status_code != 200:
             print(f"❌ Image generation failed: {response.status_code}")
             print(f"Response: {response.text}")
             return None
-            
+
+        image_url = response.json()['data'][0]['url']
+
+        # Stream the image straight to disk instead of buffering it in memory
+        with SESSION.get(image_url, stream=True, timeout=60) as img_response:
+            img_response.raise_for_status()
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(img_response.raw, f, length=1 << 16)
+
+        return filepath
+
     except Exception as e:
         print(f"❌ Error generating image: {str(e)}")
         return None
 
+def _cache_path(prompt, variant):
+    """Content-addressed cache location for one prompt/settings/variant combination"""
+    key = hashlib.sha256(
+        json.dumps({"prompt": prompt, "variant": variant, **IMAGE_PARAMS}, sort_keys=True).encode()
+    ).hexdigest()
+    return CACHE_DIR / f"{key}.png"
+
+def _generate_cached_image(prompt, variant, filepath, api_key):
+    """Serve an image from the prompt cache, generating it only on a miss"""
+    cache_path = _cache_path(prompt, variant)
+    if cache_path.exists():
+        print(f"♻️ Reusing cached portrait: {cache_path}")
+    else:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write under a temporary name so an interrupted download never looks like a hit
+        partial_path = cache_path.with_suffix(".part")
+        if not _generate_image(prompt, str(partial_path), api_key):
+            partial_path.unlink(missing_ok=True)
+            return None
+        os.replace(partial_path, cache_path)
+
+    try:
+        os.link(cache_path, filepath)
+    except OSError:
+        shutil.copyfile(cache_path, filepath)
+    return filepath
+
+def generate_mc_silk_portraits(variants=1):
+    """Generate several MC Silk portrait variants concurrently, returning the saved filenames"""
+    # Check if OpenAI API key is available - only needed when something is not cached
+    api_key = os.environ.get('OPENAI_API_KEY')
+    cached = [_cache_path(MC_SILK_PROMPT, i).exists() for i in range(variants)]
+    if not api_key and not all(cached):
+        print("No OpenAI API key found - cannot generate image")
+        return []
+
+    # Save to attached_assets with unique names
+    timestamp = int(datetime.now().timestamp())
+    if variants == 1:
+        filenames = [f"MC_Silk_new_portrait_{timestamp}.png"]
+    else:
+        filenames = [f"MC_Silk_new_portrait_{timestamp}_{i}.png" for i in range(variants)]
+
+    with ThreadPoolExecutor(max_workers=min(variants, MAX_WORKERS)) as executor:
+        futures = []
+        for i, filename in enumerate(filenames):
+            if i and not cached[i]:
+                time.sleep(REQUEST_INTERVAL)
+            futures.append(executor.submit(_generate_cached_image, MC_SILK_PROMPT, i, f"attached_assets/{filename}", api_key))
+        results = [future.result() for future in futures]
+
+    generated = []
+    for filename, filepath in zip(filenames, results):
+        if filepath:
+            print(f"✅ Generated new MC Silk portrait: {filename}")
+            print(f"📁 Saved to: {filepath}")
+            generated.append(filename)
+    return generated
+
+def generate_mc_silk_portrait():
+    """Generate a new photorealistic portrait for MC Silk"""
+    generated = generate_mc_silk_portraits(1)
+    return generated[0] if generated else None
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate MC Silk portraits with DALL-E 3")
+    parser.add_argument("--variants", type=int, default=1, help="Number of portraits to generate in parallel")
+    args = parser.parse_args()
+
     print("🎨 Generating new photorealistic portrait for MC Silk...")
-    result = generate_mc_silk_portrait()
-    
+    result = generate_mc_silk_portraits(max(1, args.variants))
+
     if result:
         print("🎉 Image generation successful!")
     else:
-        print("💥 Image generation failed - check logs above")
\ No newline at end of file
+        print("💥 Image generation failed - check logs above")
+        sys.exit(1)
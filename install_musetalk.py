@@ -7,38 +7,89 @@ Downloads models and sets up the complete MuseTalk system
 import os
 import sys
 import subprocess
-import urllib.request
 import json
 import shlex
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+HF_URL = "https://huggingface.co/{repo}/resolve/main/{file}"
+
+# (url, path under models/) for every weight file fetched over plain HTTPS.
+# 79999_iter.pth lives on Google Drive and still needs download_weights.sh (gdown).
+MODEL_WEIGHTS = [
+    (HF_URL.format(repo="TMElyralab/MuseTalk", file="musetalkV15/musetalk.json"), "musetalkV15/musetalk.json"),
+    (HF_URL.format(repo="TMElyralab/MuseTalk", file="musetalkV15/unet.pth"), "musetalkV15/unet.pth"),
+    (HF_URL.format(repo="stabilityai/sd-vae-ft-mse", file="config.json"), "sd-vae/config.json"),
+    (HF_URL.format(repo="stabilityai/sd-vae-ft-mse", file="diffusion_pytorch_model.bin"), "sd-vae/diffusion_pytorch_model.bin"),
+    (HF_URL.format(repo="openai/whisper-tiny", file="config.json"), "whisper/config.json"),
+    (HF_URL.format(repo="openai/whisper-tiny", file="pytorch_model.bin"), "whisper/pytorch_model.bin"),
+    (HF_URL.format(repo="openai/whisper-tiny", file="preprocessor_config.json"), "whisper/preprocessor_config.json"),
+    (HF_URL.format(repo="yzd-v/DWPose", file="dw-ll_ucoco_384.pth"), "dwpose/dw-ll_ucoco_384.pth"),
+    ("https://download.pytorch.org/models/resnet18-5c106cde.pth", "face-parse-bisent/resnet18-5c106cde.pth"),
+]
+MAX_DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+_session = None
+
 def run_command(cmd, cwd=None):
     """Run command and return success"""
     try:
         # Convert string command to list for safer execution
         if isinstance(cmd, str):
             cmd = shlex.split(cmd)
-        result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
-        if result.returncode != 0:
+        # Stream output line by line so long pip installs show progress without buffering the whole log
+        process = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, bufsize=1)
+        for line in process.stdout:
+            print(line, end='')
+        process.wait()
+        if process.returncode != 0:
             print(f"Command failed: {' '.join(cmd) if isinstance(cmd, list) else cmd}")
-            print(f"Error: {result.stderr}")
             return False
         return True
     except Exception as e:
         print(f"Failed to run command: {' '.join(cmd) if isinstance(cmd, list) else cmd}, Error: {e}")
         return False
 
+def _get_session():
+    """Shared HTTP session so parallel downloads reuse pooled TLS connections"""
+    global _session
+    if _session is None:
+        # Imported lazily: requests comes in with the MuseTalk requirements
+        import requests
+        from requests.adapters import HTTPAdapter
+        _session = requests.Session()
+        _session.mount('https://', HTTPAdapter(pool_maxsize=MAX_DOWNLOAD_WORKERS))
+    return _session
+
 def download_file(url, path):
     """Download file from URL"""
     try:
         print(f"Downloading: {url}")
-        urllib.request.urlretrieve(url, path)
+        with _get_session().get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
         return True
     except Exception as e:
         print(f"Failed to download {url}: {e}")
         return False
 
-def setup_musetalk():
+def download_model_weights(models_dir):
+    """Download any missing model weights in parallel"""
+    pending = [(url, models_dir / relative_path) for url, relative_path in MODEL_WEIGHTS
+               if not (models_dir / relative_path).exists()]
+    for _, path in pending:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+        results = list(executor.map(lambda item: download_file(*item), pending))
+    return all(results)
+
+def setup_musetalk(download_weights=False):
     """Setup MuseTalk with required models"""
     
     # Create MuseTalk directory if it doesn't exist
@@ -68,8 +119,12 @@ def setup_musetalk():
     (models_dir / "dwpose").mkdir(exist_ok=True)
     (models_dir / "face-parse-bisent").mkdir(exist_ok=True)
     
-    # Download models (this would need actual URLs from MuseTalk)
     print("Setting up model directories...")
+    if download_weights:
+        print("Downloading model weights...")
+        if not download_model_weights(models_dir):
+            print("Some model weights failed to download")
+            return False
     
     # Create minimal config files for testing
     configs = {
@@ -80,21 +135,30 @@ def setup_musetalk():
     
     for config_path, config_data in configs.items():
         config_file = Path(config_path)
+        if config_file.exists():
+            continue  # never clobber a downloaded config
         config_file.parent.mkdir(parents=True, exist_ok=True)
         with open(config_file, 'w') as f:
             json.dump(config_data, f)
     
     print("MuseTalk setup complete!")
-    print("Note: Model weights need to be downloaded separately")
-    print("Run: bash download_weights.sh (if available)")
+    if not download_weights:
+        print("Note: Model weights need to be downloaded separately")
+        print("Run: python install_musetalk.py --download-weights (or bash download_weights.sh)")
     
     return True
 
 def main():
+    parser = argparse.ArgumentParser(description="Install and set up MuseTalk for the rap battle game",
+                                     allow_abbrev=False)
+    parser.add_argument("--download-weights", action="store_true",
+                        help="Also download the model weights hosted on Hugging Face")
+    args = parser.parse_args()
+    
     original_dir = Path.cwd()
     
     try:
-        success = setup_musetalk()
+        success = setup_musetalk(download_weights=args.download_weights)
         if success:
             print("✅ MuseTalk installation completed successfully")
             return 0
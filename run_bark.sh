@@ -0,0 +1,17 @@
+#!/bin/bash
+# Launcher for the Bark CPU worker
+# Threading variables must be set before Python starts - MKL/OpenMP size their
+# thread pools when numpy/torch are first imported and ignore later changes.
+
+: "${OMP_NUM_THREADS:=4}"
+: "${MKL_NUM_THREADS:=$OMP_NUM_THREADS}"
+: "${OPENBLAS_NUM_THREADS:=$OMP_NUM_THREADS}"
+export OMP_NUM_THREADS MKL_NUM_THREADS OPENBLAS_NUM_THREADS
+
+# Keep each worker thread on its own core instead of migrating between them
+export MKL_DYNAMIC=FALSE
+export OMP_PROC_BIND=close
+export KMP_AFFINITY=granularity=fine,compact,1,0
+
+cd "$(dirname "$0")"
+exec python3 bark_generate.py "$@"
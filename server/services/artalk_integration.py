@@ -8,8 +8,8 @@ import os
 import sys
 import json
 import logging
-import subprocess
 import glob
+import functools
 from pathlib import Path
 from typing import Dict, Any, Optional
 
@@ -17,54 +17,80 @@ from typing import Dict, Any, Optional
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Check for ARTalk installation
-ARTALK_AVAILABLE = False
-try:
-    artalk_path = Path("ARTalk")
-    if artalk_path.exists():
-        sys.path.insert(0, str(artalk_path))
-        # Check for key files
-        required_files = [
-            artalk_path / "inference.py",
-            artalk_path / "assets" / "config.json",
-            artalk_path / "app" / "__init__.py"
-        ]
-        
-        if all(f.exists() for f in required_files):
-            ARTALK_AVAILABLE = True
-            logger.info("ARTalk installation detected")
-        else:
+# Character styles mapping
+CHARACTER_STYLES = {
+    'MC_Razor': 'style_01',  # Female aggressive style
+    'MC_Venom': 'style_02',  # Male intense style
+    'MC_Silk': 'style_03'    # Male smooth style
+}
+
+# Map character to available tracked avatars or use default mesh
+CHARACTER_SHAPES = {
+    'MC_Razor': 'mesh',  # Can be replaced with tracked avatar
+    'MC_Venom': 'mesh',
+    'MC_Silk': 'mesh'
+}
+
+ARTALK_PATH = "ARTalk"
+
+@functools.lru_cache(maxsize=1)
+def _artalk_installed() -> bool:
+    """Check for the ARTalk installation once per process, on first use"""
+    try:
+        artalk_path = Path(ARTALK_PATH)
+        if artalk_path.exists():
+            # Check for key files
+            required_files = [
+                artalk_path / "inference.py",
+                artalk_path / "assets" / "config.json",
+                artalk_path / "app" / "__init__.py"
+            ]
+            
+            if all(f.exists() for f in required_files):
+                logger.info("ARTalk installation detected")
+                return True
             logger.info("ARTalk directory found but missing required files")
-except Exception as e:
-    ARTALK_AVAILABLE = False
-    logger.info(f"ARTalk installation check failed: {e}")
+        return False
+    except Exception as e:
+        logger.info(f"ARTalk installation check failed: {e}")
+        return False
+
+def _add_artalk_to_path() -> None:
+    """Make the ARTalk modules importable; only needed once the installation is actually used"""
+    if ARTALK_PATH not in sys.path:
+        sys.path.insert(0, ARTALK_PATH)
+
+@functools.lru_cache(maxsize=1)
+def _cuda_available() -> bool:
+    """Probe for a usable GPU once per process"""
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        # Without torch, fall back to the driver's proc entry instead of spawning nvidia-smi
+        return os.path.exists('/proc/driver/nvidia/version')
+
+@functools.lru_cache(maxsize=8)
+def _character_shape(character_id: str) -> str:
+    return CHARACTER_SHAPES.get(character_id, 'mesh')
 
 class ARTalkIntegrationService:
     def __init__(self, device='cuda'):
         self.device = device if self.is_cuda_available() else 'cpu'
-        self.simulation_mode = not ARTALK_AVAILABLE
+        self.simulation_mode = not _artalk_installed()
         self.is_initialized = False
         self.engine = None
         
-        # Character styles mapping
-        self.character_styles = {
-            'MC_Razor': 'style_01',  # Female aggressive style
-            'MC_Venom': 'style_02',  # Male intense style
-            'MC_Silk': 'style_03'    # Male smooth style
-        }
+        self.character_styles = CHARACTER_STYLES
         
         logger.info(f"ARTalk service initialized - Mode: {'Full' if not self.simulation_mode else 'Simulation'}")
     
     def is_cuda_available(self) -> bool:
-        try:
-            result = subprocess.run(['nvidia-smi'], capture_output=True)
-            return result.returncode == 0
-        except:
-            return False
+        return _cuda_available()
     
     def initialize_models(self) -> bool:
         """Initialize ARTalk system"""
-        if not ARTALK_AVAILABLE:
+        if not _artalk_installed():
             logger.info("ARTalk not available - using simulation mode")
             self.simulation_mode = True
             self.is_initialized = True
@@ -72,6 +98,7 @@ class ARTalkIntegrationService:
         
         try:
             logger.info("Initializing ARTalk models...")
+            _add_artalk_to_path()
             
             # Try to import ARTalk classes - skip FLAME dependency for now
             logger.info("ARTalk models available - initializing simulation mode for now")
@@ -150,13 +177,7 @@ class ARTalkIntegrationService:
     
     def _get_character_shape(self, character_id: str) -> str:
         """Get appropriate avatar shape for character"""
-        # Map character to available tracked avatars or use default mesh
-        shape_mapping = {
-            'MC_Razor': 'mesh',  # Can be replaced with tracked avatar
-            'MC_Venom': 'mesh',
-            'MC_Silk': 'mesh'
-        }
-        return shape_mapping.get(character_id, 'mesh')
+        return _character_shape(character_id)
     
     def _generate_simulation_response(self, audio_path: str, character_id: str,
                                     output_name: Optional[str] = None) -> str:
@@ -179,7 +200,7 @@ class ARTalkIntegrationService:
     def get_status(self) -> Dict[str, Any]:
         """Get ARTalk service status"""
         return {
-            "artalk_available": ARTALK_AVAILABLE,
+            "artalk_available": _artalk_installed(),
             "simulation_mode": self.simulation_mode,
             "initialized": self.is_initialized,
             "device": self.device,
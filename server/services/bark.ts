@@ -1,10 +1,30 @@
-import { exec } from 'child_process';
+import { exec, spawn, type ChildProcessWithoutNullStreams } from 'child_process';
 import { promisify } from 'util';
 import fs from 'fs';
 import path from 'path';
+import { createHash } from 'crypto';
 
 const execAsync = promisify(exec);
 
+// Environment shared by every Bark python process
+const BARK_ENV_PREFIX = 'export LD_LIBRARY_PATH="/nix/store/*/lib:$LD_LIBRARY_PATH" && export OMP_NUM_THREADS=2 && export MKL_NUM_THREADS=2';
+
+interface BarkJob {
+  text: string;
+  output_path: string;
+  voice: string;
+  temperature: number;
+}
+
+interface PendingBarkJob {
+  id: number;
+  job: BarkJob;
+  timeoutMs: number;
+  resolve: (audioPath: string) => void;
+  reject: (error: Error) => void;
+  timer?: NodeJS.Timeout;
+}
+
 interface BarkVoiceConfig {
   historyPrompt: string;
   description: string;
@@ -39,6 +59,14 @@ export class BarkTTS {
   private readonly outputDir: string;
   private isModelPreloaded = false;
   private isBarkAvailable = false;
+  private worker: ChildProcessWithoutNullStreams | null = null;
+  private workerBuffer = '';
+  // The worker runs one job at a time; jobs wait here so their timeout only covers their own run
+  private queuedJobs: PendingBarkJob[] = [];
+  private activeJob: PendingBarkJob | null = null;
+  private nextJobId = 0;
+  // Identical requests that arrive while one is generating share its result
+  private inflight = new Map<string, Promise<{ audioPath: string; fileSize: number }>>();
 
   constructor() {
     this.outputDir = path.join(process.cwd(), 'temp_audio');
@@ -96,9 +124,9 @@ export class BarkTTS {
     console.log('🐶 Preloading Bark models...');
     
     try {
-      // Skip preloading for now - models load automatically during generation
-      // This avoids the Python string escaping issues
-      console.log('✅ Bark models will load automatically during generation');
+      // The worker loads the checkpoints once and keeps them resident for later requests
+      this.ensureWorker();
+      console.log('✅ Bark worker started - models stay loaded between generations');
       this.isModelPreloaded = true;
     } catch (error) {
       console.error('❌ Failed to preload Bark models:', error);
@@ -106,10 +134,143 @@ export class BarkTTS {
     }
   }
 
+  /**
+   * Start the persistent Bark worker process if it is not already running
+   */
+  private ensureWorker(): ChildProcessWithoutNullStreams {
+    if (this.worker) return this.worker;
+
+    const worker = spawn('bash', ['-c', `${BARK_ENV_PREFIX} && exec bash run_bark.sh --serve`]);
+    worker.stdout.setEncoding('utf8');
+    worker.stderr.setEncoding('utf8');
+
+    worker.stdout.on('data', (chunk: string) => {
+      // Ignore late output from a worker that was already replaced
+      if (this.worker !== worker) return;
+      this.workerBuffer += chunk;
+      let newline: number;
+      while ((newline = this.workerBuffer.indexOf('\n')) !== -1) {
+        const line = this.workerBuffer.slice(0, newline).trim();
+        this.workerBuffer = this.workerBuffer.slice(newline + 1);
+        if (line) this.handleWorkerMessage(line);
+      }
+    });
+
+    worker.stderr.on('data', (chunk: string) => {
+      if (!chunk.includes('Warning') && !chunk.includes('UserWarning')) {
+        console.error('Bark worker stderr:', chunk.trim());
+      }
+    });
+
+    worker.on('error', (error) => console.error('❌ Bark worker error:', error));
+    worker.stdin.on('error', (error) => console.error('❌ Bark worker stdin error:', error));
+
+    worker.on('exit', (code) => {
+      console.warn(`🐶 Bark worker exited (code ${code})`);
+      if (this.worker !== worker) return;
+      this.worker = null;
+      this.workerBuffer = '';
+      this.isModelPreloaded = false;
+      if (this.activeJob) {
+        clearTimeout(this.activeJob.timer);
+        this.activeJob.reject(new Error('Bark worker exited'));
+        this.activeJob = null;
+      }
+      // Jobs that were never sent run on a fresh worker
+      this.sendNextJob();
+    });
+
+    this.worker = worker;
+    return worker;
+  }
+
+  /**
+   * Route a JSON result line from the worker to the request waiting on it
+   */
+  private handleWorkerMessage(line: string): void {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch {
+      console.log('Bark worker output:', line);
+      return;
+    }
+
+    if (message.ready) {
+      console.log('🐶 Bark worker ready');
+      return;
+    }
+
+    const pending = this.activeJob;
+    if (!pending || pending.id !== message.id) return;
+
+    this.activeJob = null;
+    clearTimeout(pending.timer);
+    if (message.success) {
+      pending.resolve(message.audio_path);
+    } else {
+      pending.reject(new Error(message.error || 'Bark generation failed'));
+    }
+    this.sendNextJob();
+  }
+
+  /**
+   * Write the next queued job to the worker once it is idle, starting that job's timeout
+   */
+  private sendNextJob(): void {
+    if (this.activeJob || this.queuedJobs.length === 0) return;
+
+    const worker = this.ensureWorker();
+    const pending = this.queuedJobs.shift()!;
+    pending.timer = setTimeout(() => {
+      // The worker can't abandon a generation; restart it so later jobs don't queue behind this one
+      console.warn('⏰ Bark generation timed out - restarting worker');
+      this.activeJob = null;
+      pending.reject(new Error('Bark generation timeout'));
+      this.worker = null;
+      this.workerBuffer = '';
+      this.isModelPreloaded = false;
+      worker.kill('SIGKILL');
+      this.sendNextJob();
+    }, pending.timeoutMs);
+
+    this.activeJob = pending;
+    worker.stdin.write(JSON.stringify({ id: pending.id, ...pending.job }) + '\n');
+  }
+
+  /**
+   * Queue a synthesis job for the worker and wait for its result
+   */
+  private runWorkerJob(job: BarkJob, timeoutMs: number): Promise<string> {
+    const id = ++this.nextJobId;
+
+    return new Promise((resolve, reject) => {
+      this.queuedJobs.push({ id, job, timeoutMs, resolve, reject });
+      this.sendNextJob();
+    });
+  }
+
   /**
    * Generate audio from text using Bark TTS (with fallback)
    */
   async generateAudio(text: string, characterId: string): Promise<{ audioPath: string; fileSize: number }> {
+    const key = createHash('sha256').update(JSON.stringify([characterId, text])).digest('hex');
+    const existing = this.inflight.get(key);
+    if (existing) {
+      console.log(`♻️ Joining in-flight Bark generation for ${characterId}`);
+      return existing;
+    }
+
+    const generation = this.doGenerateAudio(text, characterId);
+    this.inflight.set(key, generation);
+    try {
+      return await generation;
+    } finally {
+      this.inflight.delete(key);
+    }
+  }
+
+  private async doGenerateAudio(text: string, characterId: string): Promise<{ audioPath: string; fileSize: number }> {
     // If Bark is not available, create a placeholder that indicates fallback is needed
     if (!this.isBarkAvailable) {
       console.log(`📢 Bark not available for ${characterId}, will use Typecast fallback`);
@@ -143,17 +304,13 @@ export class BarkTTS {
         console.log(`🤖 CYPHER-9000 VOICE PROTOCOL: Processing with robotic effects`);
       }
       
-      // Use dedicated generation script with aggressive CPU optimization
-      const { stdout, stderr } = await execAsync(
-        `export LD_LIBRARY_PATH="/nix/store/*/lib:$LD_LIBRARY_PATH" && export OMP_NUM_THREADS=2 && export MKL_NUM_THREADS=2 && python3 bark_generate.py "${cleanText.replace(/"/g, '\\"')}" "${outputPath}" --voice "${voiceConfig.historyPrompt}" --temp ${voiceConfig.temperature}`,
-        { timeout: 30000 } // 30 second timeout for faster fallback
-      );
-
-      if (stderr && !stderr.includes('Warning') && !stderr.includes('UserWarning')) {
-        console.error('Bark generation stderr:', stderr);
-      }
-
-      console.log('Bark generation output:', stdout);
+      // Hand the job to the warm worker with aggressive CPU optimization
+      await this.runWorkerJob({
+        text: cleanText,
+        output_path: outputPath,
+        voice: voiceConfig.historyPrompt,
+        temperature: voiceConfig.temperature
+      }, 30000); // 30 second timeout for faster fallback
 
       // Verify file was created
       if (!fs.existsSync(outputPath)) {
@@ -10,10 +10,20 @@ import json
 import argparse
 import tempfile
 import subprocess
-import shlex
+import pickle
+import hashlib
+import mmap
+import shutil
+import functools
+import contextlib
+import types
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Dict, Any
-import base64
 import logging
 
 # Add MuseTalk to Python path
@@ -24,13 +34,15 @@ try:
     import torch
     import cv2
     import numpy as np
-    from omegaconf import OmegaConf
+    import soundfile as sf
     from transformers import WhisperModel
     
     # Import MuseTalk modules
     from musetalk.utils.face_parsing import FaceParsing
-    from musetalk.utils.utils import datagen, load_all_model
-    from musetalk.utils.preprocessing import get_landmark_and_bbox, read_imgs
+    from diffusers import UNet2DConditionModel
+    from musetalk.models.unet import PositionalEncoding
+    from musetalk.models.vae import VAE
+    from musetalk.utils.preprocessing import get_landmark_and_bbox, coord_placeholder
     from musetalk.utils.blending import get_image_prepare_material, get_image_blending
     from musetalk.utils.audio_processor import AudioProcessor
     
@@ -39,9 +51,193 @@ except ImportError as e:
     print(f"MuseTalk dependencies not available: {e}")
     MUSETALK_AVAILABLE = False
 
+# Optional: in-process NVENC sessions for the static placeholder video
+try:
+    import PyNvVideoCodec as pnvc
+    PYNVC_AVAILABLE = True
+except ImportError:
+    PYNVC_AVAILABLE = False
+
+# Optional: live WebRTC output instead of MP4 files
+try:
+    import asyncio
+    import fractions
+    import av
+    from aiortc import MediaStreamTrack
+    from aiortc.contrib.media import MediaPlayer
+    from aiortc.mediastreams import MediaStreamError
+    AIORTC_AVAILABLE = True
+except ImportError:
+    AIORTC_AVAILABLE = False
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FPS = 25
+# Frames per UNet forward pass; batching amortizes kernel launches and Python overhead
+UNET_BATCH_SIZE = 16
+# v1.5 extends the face box downwards to cover the chin
+EXTRA_MARGIN = 10
+# Decoded batches allowed to wait for blending/encoding while the GPU runs ahead
+PIPELINE_DEPTH = 3
+# How long the UNet batcher waits for other renders' batches, and how many it merges
+BATCH_WINDOW = 0.02
+MAX_COALESCED_RENDERS = 4
+# Whisper features kept in memory for recently rendered audio (backing tracks repeat a lot)
+AUDIO_FEATURE_CACHE_SIZE = 64
+# Seconds a live track waits for the renderer's next frame before treating the stream as dead
+FRAME_WAIT_TIMEOUT = 30
+
+@functools.lru_cache(maxsize=1)
+def _nvenc_available() -> bool:
+    """Check once per process whether ffmpeg can encode on an NVIDIA GPU"""
+    if not MUSETALK_AVAILABLE or not torch.cuda.is_available():
+        return False
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                capture_output=True, text=True, timeout=5)
+        return 'h264_nvenc' in result.stdout
+    except Exception:
+        return False
+
+def _video_encoder_args(still_image: bool = True) -> list:
+    """Encoder flags; placeholder stills don't need visual fidelity, rendered frames do"""
+    if _nvenc_available():
+        return ['-c:v', 'h264_nvenc', '-preset', 'p1' if still_image else 'p4']
+    if still_image:
+        return ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'stillimage', '-crf', '28']
+    return ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18']
+
+def _copy_file(src: str, dst: str) -> None:
+    """Copy src to dst in-kernel with sendfile, avoiding a user-space buffer"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+
+if AIORTC_AVAILABLE:
+    class MuseTalkVideoTrack(MediaStreamTrack):
+        """WebRTC video track fed with blended frames as the renderer produces them"""
+        
+        kind = "video"
+        CLOCK_RATE = 90000
+        
+        def __init__(self):
+            super().__init__()
+            # Bounded so a fast GPU blocks instead of buffering a whole clip of raw frames
+            self._frames = queue.Queue(maxsize=2 * FPS)
+            self._frame_index = 0
+            self._start = None
+        
+        def push(self, frame) -> None:
+            """Called from the render thread; None marks the end of the stream"""
+            while True:
+                # A closed peer stops reading; fail the render instead of blocking its thread forever
+                if self.readyState == "ended":
+                    if frame is None:
+                        return
+                    raise RuntimeError("Video track stopped")
+                try:
+                    self._frames.put(frame, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+        
+        async def recv(self):
+            try:
+                frame = await asyncio.get_running_loop().run_in_executor(
+                    None, self._frames.get, True, FRAME_WAIT_TIMEOUT)
+            except queue.Empty:
+                logger.error("Live lip sync renderer stalled, ending video track")
+                frame = None
+            if frame is None:
+                self.stop()
+                raise MediaStreamError
+            
+            # Pace output to the 25 fps clock so the audio track stays in sync
+            if self._start is None:
+                self._start = time.monotonic()
+            delay = self._start + self._frame_index / FPS - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+            video_frame.pts = self._frame_index * (self.CLOCK_RATE // FPS)
+            video_frame.time_base = fractions.Fraction(1, self.CLOCK_RATE)
+            self._frame_index += 1
+            return video_frame
+
+class _UNetBatcher:
+    """Merges UNet batches from concurrent renders into shared forward passes"""
+    
+    def __init__(self, forward, device, max_frames: int, window: float = BATCH_WINDOW):
+        self._forward = forward
+        self._device = device
+        self._max_frames = max_frames
+        self._window = window
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._active_renders = 0
+        self._thread = None
+    
+    @contextlib.contextmanager
+    def render(self):
+        """Mark a render as in flight; the batcher only waits for company when there is some"""
+        with self._lock:
+            self._active_renders += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active_renders -= 1
+    
+    def submit(self, latent_batch, audio_feature_batch):
+        """Run one render's batch through the UNet, possibly alongside other renders' batches"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        future = Future()
+        self._requests.put((latent_batch, audio_feature_batch, future))
+        return future.result()
+    
+    def _run(self):
+        autocast = (torch.autocast(device_type='cuda', dtype=torch.float16)
+                    if self._device.type == 'cuda' else contextlib.nullcontext())
+        # Grad mode and autocast are thread-local, so the worker sets up its own
+        with torch.inference_mode(), autocast:
+            while True:
+                pending = [self._requests.get()]
+                num_frames = pending[0][1].shape[0]
+                deadline = time.monotonic() + self._window
+                while num_frames < self._max_frames and self._active_renders > 1:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = self._requests.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    pending.append(request)
+                    num_frames += request[1].shape[0]
+                
+                try:
+                    pred_latents = self._forward(torch.cat([r[0] for r in pending]),
+                                                 torch.cat([r[1] for r in pending]))
+                    start = 0
+                    for latent_batch, _, future in pending:
+                        end = start + latent_batch.shape[0]
+                        # Clone: a replayed CUDA graph overwrites its output buffer on the next batch
+                        future.set_result(pred_latents[start:end].clone())
+                        start = end
+                except Exception as e:
+                    for _, _, future in pending:
+                        future.set_exception(e)
+
 class MuseTalkLipSync:
     """Real-time lip sync processor using MuseTalk"""
     
@@ -49,6 +245,21 @@ class MuseTalkLipSync:
         self.initialized = False
         self.models = {}
         self.avatars = {}
+        self.avatar_materials = {}
+        # NV12 placeholder frames per avatar, converted once and fed to every NVENC encode
+        self.avatar_nv12 = {}
+        self.face_parser = None
+        self.models_loaded = False
+        # Captured UNet forwards on CUDA keyed by input shapes; disabled once a capture fails
+        self.unet_graphs = {}
+        self.cuda_graphs_enabled = True
+        self.unet_batcher = None
+        self.audio_feature_cache = collections.OrderedDict()
+        # Concurrent serve jobs share the LRU; OrderedDict reordering/eviction isn't thread-safe
+        self.audio_feature_lock = threading.Lock()
+        # Serializes the one-time network/face parser loads when the worker runs jobs concurrently;
+        # reentrant because the full network load also loads Whisper
+        self.model_lock = threading.RLock()
         
         if not MUSETALK_AVAILABLE:
             logger.warning("MuseTalk not available, running in simulation mode")
@@ -76,26 +287,35 @@ class MuseTalkLipSync:
                 'face-parse-bisent/79999_iter.pth'
             ]
             
-            missing_models = []
-            for model_path in required_models:
-                full_path = os.path.join(self.models_dir, model_path)
-                if not os.path.exists(full_path):
-                    missing_models.append(model_path)
+            # One directory listing per weights folder instead of a stat per file
+            present = set()
+            for model_dir in {os.path.dirname(m) for m in required_models}:
+                try:
+                    with os.scandir(os.path.join(self.models_dir, model_dir)) as entries:
+                        present.update(f"{model_dir}/{entry.name}" for entry in entries if entry.is_file())
+                except OSError:
+                    continue
+            missing_models = [m for m in required_models if m not in present]
                     
             if missing_models:
                 logger.error(f"Missing MuseTalk models: {missing_models}")
                 logger.info("Please run: cd MuseTalk && sh download_weights.sh")
                 return False
                 
-            # Load models (this would be the actual MuseTalk model loading)
-            # For now, we'll simulate the initialization
-            self.models = {
+            # Networks are loaded lazily on the first render; keep the checkpoint paths here
+            self.model_paths = {
                 'unet': f"{self.models_dir}/musetalkV15/unet.pth",
                 'vae': f"{self.models_dir}/sd-vae/diffusion_pytorch_model.bin",
                 'whisper': f"{self.models_dir}/whisper/pytorch_model.bin",
                 'face_parser': f"{self.models_dir}/face-parse-bisent/79999_iter.pth"
             }
             
+            # Warm the audio encoder now so the first render only pays for the UNet/VAE load
+            try:
+                self._load_whisper(torch.device("cuda" if torch.cuda.is_available() else "cpu"))
+            except Exception as e:
+                logger.warning(f"Whisper warm-up failed, will retry on first render: {e}")
+            
             logger.info("MuseTalk models initialized successfully")
             self.initialized = True
             return True
@@ -107,38 +327,37 @@ class MuseTalkLipSync:
     def prepare_avatar(self, image_path: str, avatar_id: str) -> Dict[str, Any]:
         """Prepare avatar for lip sync processing"""
         try:
-            if not self.initialized and not self.initialize_models():
-                return {"success": False, "error": "MuseTalk not initialized"}
-                
             logger.info(f"Preparing avatar {avatar_id} from {image_path}")
             
-            # Create avatar directory
-            avatar_dir = os.path.join(self.results_dir, 'avatars', avatar_id)
-            os.makedirs(avatar_dir, exist_ok=True)
-            
-            # Copy image to avatar directory
-            import shutil
-            avatar_image = os.path.join(avatar_dir, 'avatar.png')
-            shutil.copy2(image_path, avatar_image)
-            
-            # For now, simulate avatar preparation
-            # In full implementation, this would process the face landmarks, 
-            # extract facial features, and prepare for real-time inference
+            # Prepared material is stored by image content so restarts and
+            # re-uploads of the same portrait skip face detection entirely
+            with open(image_path, 'rb') as f:
+                image_hash = hashlib.sha256(f.read()).hexdigest()
+            avatars_root = os.path.join(self.results_dir, 'avatars')
+            avatar_dir = os.path.join(avatars_root, image_hash)
+            info_path = os.path.join(avatar_dir, 'avatar_info.json')
             
-            avatar_info = {
-                "avatar_id": avatar_id,
-                "image_path": avatar_image,
-                "prepared": True,
-                "bbox_shift": 0,  # This would be calculated from face detection
-                "landmarks": []   # This would contain facial landmarks
-            }
+            if os.path.exists(info_path):
+                logger.info(f"Reusing prepared avatar {image_hash[:12]} for {avatar_id}")
+                avatar_info = json.loads(Path(info_path).read_text())
+            else:
+                if not self.initialized and not self.initialize_models():
+                    return {"success": False, "error": "MuseTalk not initialized"}
+                avatar_info = self._build_avatar(image_path, avatar_dir, image_hash)
             
-            # Save avatar info
-            info_path = os.path.join(avatar_dir, 'avatar_info.json')
-            with open(info_path, 'w') as f:
-                json.dump(avatar_info, f, indent=2)
-                
+            avatar_info["avatar_id"] = avatar_id
+            self._link_avatar_id(avatars_root, avatar_id, image_hash)
             self.avatars[avatar_id] = avatar_info
+            self.avatar_materials.pop(avatar_id, None)
+            self.avatar_nv12.pop(avatar_id, None)
+            if PYNVC_AVAILABLE and torch.cuda.is_available():
+                self._get_avatar_nv12(avatar_id, avatar_info)
+            
+            # With the networks already resident, encode the face latent now rather than on first render
+            if self.models_loaded:
+                material = self._load_avatar_material(avatar_id)
+                if material is not None:
+                    self._get_avatar_latent(avatar_id, material)
             
             return {
                 "success": True, 
@@ -150,38 +369,589 @@ class MuseTalkLipSync:
             logger.error(f"Avatar preparation failed: {e}")
             return {"success": False, "error": str(e)}
     
+    def _build_avatar(self, image_path: str, avatar_dir: str, image_hash: str) -> Dict[str, Any]:
+        """Copy the image into the content-addressed avatar dir and precompute its face material"""
+        os.makedirs(avatar_dir, exist_ok=True)
+        
+        # Copy image to avatar directory
+        avatar_image = os.path.join(avatar_dir, 'avatar.png')
+        _copy_file(image_path, avatar_image)
+        
+        # Run face detection and parsing once here so inference only loads the results
+        material = self._compute_avatar_material(avatar_image)
+        material_path = os.path.join(avatar_dir, 'avatar_material.pkl')
+        if material is not None:
+            with open(material_path, 'wb') as f:
+                pickle.dump(material, f)
+        
+        # Raw yuv420p copy of the still so placeholder videos skip PNG decode and colour conversion per frame
+        raw_frame = None
+        image = cv2.imread(avatar_image)
+        if image is not None:
+            height, width = image.shape[0] & ~1, image.shape[1] & ~1
+            raw_path = os.path.join(avatar_dir, 'avatar.yuv')
+            cv2.cvtColor(image[:height, :width], cv2.COLOR_BGR2YUV_I420).tofile(raw_path)
+            raw_frame = {"path": raw_path, "width": width, "height": height}
+        
+        avatar_info = {
+            "image_hash": image_hash,
+            "raw_frame": raw_frame,
+            "image_path": avatar_image,
+            "prepared": True,
+            "bbox_shift": 0,
+            "bbox": [int(v) for v in material["bbox"]] if material else None,
+            "material_path": material_path if material else None
+        }
+        
+        # Written last: its presence marks the directory as a complete cache entry
+        Path(avatar_dir, 'avatar_info.json').write_text(json.dumps(avatar_info, indent=2))
+        return avatar_info
+    
+    def _link_avatar_id(self, avatars_root: str, avatar_id: str, image_hash: str) -> None:
+        """Point results/avatars/<avatar_id> at the hashed avatar directory"""
+        link_path = os.path.join(avatars_root, avatar_id)
+        if os.path.islink(link_path):
+            if os.readlink(link_path) == image_hash:
+                return
+        elif os.path.isdir(link_path):
+            # Directory left by the old per-id layout
+            shutil.rmtree(link_path, ignore_errors=True)
+        # Concurrent jobs for the same avatar may both get here; swapping in a fresh link is atomic
+        tmp_link = f"{link_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.symlink(image_hash, tmp_link)
+        os.replace(tmp_link, link_path)
+    
+    def _get_avatar(self, avatar_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a prepared avatar, falling back to the on-disk cache after a restart"""
+        if avatar_id in self.avatars:
+            return self.avatars[avatar_id]
+        
+        info_path = os.path.join(self.results_dir, 'avatars', avatar_id, 'avatar_info.json')
+        if not os.path.exists(info_path):
+            return None
+        
+        avatar_info = json.loads(Path(info_path).read_text())
+        avatar_info["avatar_id"] = avatar_id
+        self.avatars[avatar_id] = avatar_info
+        return avatar_info
+    
+    def _compute_avatar_material(self, image_path: str) -> Optional[Dict[str, Any]]:
+        """Detect the face and build the blending mask for a single avatar image"""
+        coord_list, frame_list = get_landmark_and_bbox([image_path], 0)
+        bbox = coord_list[0]
+        if bbox == coord_placeholder:
+            logger.warning(f"No face detected in {image_path}")
+            return None
+        
+        frame = frame_list[0]
+        x1, y1, x2, y2 = bbox
+        bbox = [int(x1), int(y1), int(x2), int(min(y2 + EXTRA_MARGIN, frame.shape[0]))]
+        
+        if self.face_parser is None:
+            with self.model_lock:
+                if self.face_parser is None:
+                    self.face_parser = FaceParsing(left_cheek_width=90, right_cheek_width=90)
+        mask, crop_box = get_image_prepare_material(frame, bbox, fp=self.face_parser, mode="jaw")
+        
+        # Keep the decoded frame and the UNet-sized face crop so renders never re-decode the PNG
+        x1, y1, x2, y2 = bbox
+        crop_frame = cv2.resize(frame[y1:y2, x1:x2], (256, 256), interpolation=cv2.INTER_LANCZOS4)
+        
+        return {"bbox": bbox, "mask": mask, "crop_box": crop_box, "frame": frame, "crop_frame": crop_frame}
+    
+    def _load_avatar_material(self, avatar_id: str) -> Optional[Dict[str, Any]]:
+        """Load the precomputed face material for an avatar, keeping it in memory"""
+        if avatar_id in self.avatar_materials:
+            return self.avatar_materials[avatar_id]
+        
+        material_path = self.avatars[avatar_id].get("material_path")
+        if not material_path or not os.path.exists(material_path):
+            return None
+        
+        with open(material_path, 'rb') as f:
+            material = pickle.load(f)
+        self.avatar_materials[avatar_id] = material
+        return material
+    
+    def _load_inference_models(self) -> bool:
+        """Load the MuseTalk networks into memory for in-process inference"""
+        if self.models_loaded:
+            return True
+        with self.model_lock:
+            if self.models_loaded:
+                return True
+            return self._load_inference_models_locked()
+    
+    def _load_inference_models_locked(self) -> bool:
+        try:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            if device.type == 'cuda':
+                # Let any FP32 leftovers (VAE encode, blending convs) run on tensor cores;
+                # UNet batch shapes are fixed so cuDNN autotuning pays off after the first batch
+                torch.set_float32_matmul_precision('high')
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                torch.backends.cudnn.benchmark = True
+            # Absolute path: load_all_model resolves the VAE relative to the working directory
+            vae = VAE(model_path=os.path.join(self.models_dir, 'sd-vae'))
+            pe = PositionalEncoding(d_model=384)
+            unet = self._load_unet(
+                os.path.join(self.models_dir, 'musetalkV15', 'musetalk.json'),
+                os.path.join(self.models_dir, 'musetalkV15', 'unet.pth'),
+                device
+            )
+            if device.type == 'cuda':
+                pe = pe.half()
+                vae.vae = vae.vae.half()
+            else:
+                self._quantize_vae_decoder(vae)
+            pe = pe.to(device)
+            vae.vae = vae.vae.to(device)
+            
+            # Opt-in: inductor fuses the UNet's conv/norm/activation chains, but compiling
+            # every batch shape adds minutes to the first renders
+            if device.type == 'cuda' and os.environ.get('MUSETALK_COMPILE') == '1' and hasattr(torch, 'compile'):
+                unet.model = torch.compile(unet.model, dynamic=False)
+                logger.info("MuseTalk UNet wrapped with torch.compile")
+            
+            self._load_whisper(device)
+            self.models.update({
+                'device': device,
+                'vae': vae,
+                'unet': unet,
+                'pe': pe,
+                'timesteps': torch.tensor([0], device=device)
+            })
+            self.unet_batcher = _UNetBatcher(self._unet_forward, device,
+                                             max_frames=UNET_BATCH_SIZE * MAX_COALESCED_RENDERS)
+            self.models_loaded = True
+            return True
+            
+        except Exception as e:
+            logger.warning(f"MuseTalk inference models unavailable, using placeholder video: {e}")
+            return False
+    
+    def _load_unet(self, config_path: str, weights_path: str, device):
+        """Build the UNet on the target device and stream its checkpoint in from a memory map"""
+        with open(config_path, 'r') as f:
+            model = UNet2DConditionModel(**json.load(f))
+        dtype = torch.float16 if device.type == 'cuda' else torch.float32
+        model = model.to(device=device, dtype=dtype)
+        
+        # mmap pages the checkpoint in on demand instead of reading the whole file up front
+        try:
+            state = torch.load(weights_path, map_location='cpu', mmap=True, weights_only=True)
+        except (TypeError, RuntimeError):
+            state = torch.load(weights_path, map_location='cpu')
+        if device.type == 'cuda':
+            # Stage through pinned memory so load_state_dict's host-to-device copies run at full DMA speed
+            state = {k: v.to(dtype).pin_memory() for k, v in state.items()}
+        model.load_state_dict(state)
+        del state
+        
+        return types.SimpleNamespace(model=model.eval())
+    
+    def _quantize_vae_decoder(self, vae) -> None:
+        """INT8 dynamic quantization of the VAE decoder for CPU-only hosts"""
+        # Dynamic quantization only covers Linear layers (the decoder's attention projections);
+        # the convolutions stay FP32 but run through oneDNN
+        try:
+            vae.vae.decoder = torch.ao.quantization.quantize_dynamic(
+                vae.vae.decoder, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("VAE decoder quantized to INT8")
+        except Exception as e:
+            logger.warning(f"VAE decoder quantization failed, keeping FP32: {e}")
+    
+    def _load_whisper(self, device) -> None:
+        """Load the Whisper encoder and feature extractor once and share them across requests"""
+        if 'whisper' in self.models:
+            return
+        with self.model_lock:
+            if 'whisper' not in self.models:
+                self._load_whisper_locked(device)
+    
+    def _load_whisper_locked(self, device) -> None:
+        whisper_dir = os.path.join(self.models_dir, 'whisper')
+        dtype = torch.float16 if device.type == 'cuda' else torch.float32
+        # Load straight into the target dtype instead of materialising FP32 weights first
+        whisper = WhisperModel.from_pretrained(whisper_dir, torch_dtype=dtype)
+        whisper = whisper.to(device).eval()
+        whisper.requires_grad_(False)
+        
+        # 'whisper' is the loaded marker checked without the lock, so it goes in last
+        self.models['audio_processor'] = AudioProcessor(feature_extractor_path=whisper_dir)
+        self.models['whisper'] = whisper
+    
+    def _get_avatar_latent(self, avatar_id: str, material: Dict[str, Any]):
+        """VAE latent of the avatar face crop, encoded once and cached next to the avatar material"""
+        if 'latent' in material:
+            return material['latent']
+        
+        device = self.models['device']
+        latent_path = os.path.join(os.path.dirname(self.avatars[avatar_id]['material_path']), 'avatar_latent.pt')
+        if os.path.exists(latent_path):
+            try:
+                latent = torch.load(latent_path, map_location='cpu', mmap=True, weights_only=True)
+            except (TypeError, RuntimeError):
+                latent = torch.load(latent_path, map_location='cpu')
+            latent = latent.to(device)
+        else:
+            with torch.inference_mode():
+                latent = self.models['vae'].get_latents_for_unet(material['crop_frame'])
+            torch.save(latent.cpu(), latent_path)
+        
+        material['latent'] = latent
+        return latent
+    
+    def _capture_unet_graph(self, latent_batch, audio_feature_batch):
+        """Capture a UNet forward for these input shapes as a CUDA graph so each batch is a single replay"""
+        device = self.models['device']
+        unet_model = self.models['unet'].model
+        
+        static_latent = torch.zeros(latent_batch.shape, device=device, dtype=unet_model.dtype)
+        static_audio = torch.zeros(audio_feature_batch.shape, device=device, dtype=unet_model.dtype)
+        static_timesteps = torch.tensor([0], device=device)
+        
+        # The weights are already FP16, and autocast's cast cache does not survive graph capture
+        with torch.autocast(device_type='cuda', enabled=False):
+            # Warm up on a side stream so cuDNN autotuning and allocator growth happen outside capture
+            side_stream = torch.cuda.Stream()
+            side_stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(side_stream):
+                for _ in range(3):
+                    unet_model(static_latent, static_timesteps, encoder_hidden_states=static_audio)
+            torch.cuda.current_stream().wait_stream(side_stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_out = unet_model(static_latent, static_timesteps, encoder_hidden_states=static_audio).sample
+        
+        return {'graph': graph, 'latent': static_latent, 'audio': static_audio, 'out': static_out}
+    
+    def _unet_forward(self, latent_batch, audio_feature_batch):
+        """UNet forward for one batch, replaying a captured graph for whole multiples of the render batch"""
+        unet_model = self.models['unet'].model
+        batch_size = audio_feature_batch.shape[0]
+        
+        if (self.models['device'].type == 'cuda' and self.cuda_graphs_enabled
+                and batch_size % UNET_BATCH_SIZE == 0):
+            try:
+                key = (tuple(latent_batch.shape), tuple(audio_feature_batch.shape))
+                graph = self.unet_graphs.get(key)
+                if graph is None:
+                    graph = self.unet_graphs[key] = self._capture_unet_graph(latent_batch, audio_feature_batch)
+                graph['latent'].copy_(latent_batch)
+                graph['audio'].copy_(audio_feature_batch)
+                graph['graph'].replay()
+                # Consumers must finish with this before the next replay overwrites it
+                return graph['out']
+            except Exception as e:
+                logger.warning(f"CUDA graph capture failed, using eager UNet: {e}")
+                self.cuda_graphs_enabled = False
+        
+        latent_batch = latent_batch.to(dtype=unet_model.dtype).contiguous()
+        return unet_model(latent_batch, self.models['timesteps'], encoder_hidden_states=audio_feature_batch).sample
+    
+    def _get_whisper_chunks(self, audio_path: str):
+        """Per-frame Whisper features for an audio file, cached in memory and on disk by content hash"""
+        device = self.models['device']
+        dtype = self.models['unet'].model.dtype
+        padding_left, padding_right = 2, 2
+        
+        # The features depend on how they were computed as well as on the audio
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(audio_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    hasher.update(data)
+            # mmap can't map an empty file; nothing to hash then
+        hasher.update(json.dumps([device.type, str(dtype), FPS, padding_left, padding_right]).encode())
+        audio_hash = hasher.hexdigest()
+        
+        with self.audio_feature_lock:
+            whisper_chunks = self.audio_feature_cache.get(audio_hash)
+            if whisper_chunks is not None:
+                self.audio_feature_cache.move_to_end(audio_hash)
+                return whisper_chunks
+        
+        cache_dir = os.path.join(self.results_dir, 'whisper_cache')
+        cache_path = os.path.join(cache_dir, f"{audio_hash}.pt")
+        if os.path.exists(cache_path):
+            # Plain tensors only; anything else in the results directory is refused, not unpickled
+            whisper_chunks = torch.load(cache_path, map_location='cpu', weights_only=True)
+        else:
+            audio_processor = self.models['audio_processor']
+            if device.type == 'cuda':
+                # Log-mel on the GPU: no per-segment CPU STFT and no host-to-device copy of the mels
+                whisper_features, librosa_length = audio_processor.get_audio_feature_gpu(audio_path, device)
+            else:
+                whisper_features, librosa_length = audio_processor.get_audio_feature(audio_path)
+            whisper_chunks = audio_processor.get_whisper_chunk(
+                whisper_features, device, dtype, self.models['whisper'], librosa_length,
+                fps=FPS, audio_padding_length_left=padding_left, audio_padding_length_right=padding_right
+            ).cpu()
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write-then-rename so a concurrent reader never sees a partial file
+            partial_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.part"
+            torch.save(whisper_chunks, partial_path)
+            os.replace(partial_path, cache_path)
+        
+        with self.audio_feature_lock:
+            self.audio_feature_cache[audio_hash] = whisper_chunks
+            self.audio_feature_cache.move_to_end(audio_hash)
+            if len(self.audio_feature_cache) > AUDIO_FEATURE_CACHE_SIZE:
+                self.audio_feature_cache.popitem(last=False)
+        return whisper_chunks
+    
+    def _ensure_avatar_frame(self, avatar_id: str, material: Dict[str, Any]) -> None:
+        """Decode the avatar frame for material prepared before frames were cached alongside it"""
+        if 'frame' in material:
+            return
+        frame = cv2.imread(self.avatars[avatar_id]['image_path'])
+        x1, y1, x2, y2 = material['bbox']
+        material['frame'] = frame
+        material['crop_frame'] = cv2.resize(frame[y1:y2, x1:x2], (256, 256), interpolation=cv2.INTER_LANCZOS4)
+    
+    def _render_frames(self, avatar_id: str, audio_path: str, material: Dict[str, Any], emit) -> int:
+        """Run MuseTalk over the audio in frame batches, handing each blended BGR frame to emit"""
+        device = self.models['device']
+        vae, pe = self.models['vae'], self.models['pe']
+        
+        self._ensure_avatar_frame(avatar_id, material)
+        frame = material['frame']
+        x1, y1, x2, y2 = material['bbox']
+        latent = self._get_avatar_latent(avatar_id, material)
+        
+        autocast = (torch.autocast(device_type='cuda', dtype=torch.float16)
+                    if device.type == 'cuda' else contextlib.nullcontext())
+        
+        # CPU blending and the frame sink run on their own thread so batch N is
+        # composited and emitted while the GPU works on batch N+1
+        decoded_batches = queue.Queue(maxsize=PIPELINE_DEPTH)
+        writer_errors = []
+        
+        def blend_and_emit():
+            while True:
+                res_frames = decoded_batches.get()
+                if res_frames is None:
+                    return
+                if writer_errors:
+                    continue  # keep draining so the producer never blocks
+                try:
+                    for res_frame in res_frames:
+                        res_frame = cv2.resize(res_frame.astype(np.uint8), (x2 - x1, y2 - y1))
+                        combined = get_image_blending(frame, res_frame, [x1, y1, x2, y2],
+                                                      material['mask'], material['crop_box'])
+                        emit(np.ascontiguousarray(combined))
+                except Exception as e:
+                    writer_errors.append(e)
+        
+        writer = threading.Thread(target=blend_and_emit, daemon=True)
+        writer.start()
+        
+        try:
+            with torch.inference_mode(), autocast, self.unet_batcher.render():
+                whisper_chunks = self._get_whisper_chunks(audio_path)
+                num_frames = len(whisper_chunks)
+                
+                for start in range(0, num_frames, UNET_BATCH_SIZE):
+                    whisper_batch = whisper_chunks[start:start + UNET_BATCH_SIZE].to(device)
+                    audio_feature_batch = pe(whisper_batch)
+                    latent_batch = latent.expand(audio_feature_batch.shape[0], *latent.shape[1:])
+                    pred_latents = self.unet_batcher.submit(latent_batch, audio_feature_batch)
+                    # decode_latents returns host arrays, so the graph output can be reused right away
+                    decoded_batches.put(vae.decode_latents(pred_latents))
+        finally:
+            decoded_batches.put(None)
+            writer.join()
+        
+        if writer_errors:
+            raise writer_errors[0]
+        return num_frames
+    
+    def _render_lipsync_video(self, avatar_id: str, audio_path: str, output_path: str,
+                              material: Dict[str, Any]) -> float:
+        """Render the lip-synced frames and encode them with the audio; returns duration"""
+        self._ensure_avatar_frame(avatar_id, material)
+        height, width = material['frame'].shape[:2]
+        
+        # Stream blended BGR frames straight into the encoder instead of writing PNGs
+        encoder = subprocess.Popen([
+            'ffmpeg', '-y', '-v', 'warning',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(FPS), '-i', '-',
+            '-i', audio_path,
+            *_video_encoder_args(still_image=False),
+            '-threads', '0',
+            '-c:a', 'aac', '-b:a', '192k',
+            '-pix_fmt', 'yuv420p',
+            '-shortest',
+            output_path
+        ], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        num_frames = None
+        try:
+            num_frames = self._render_frames(avatar_id, audio_path, material,
+                                             lambda combined: encoder.stdin.write(combined.tobytes()))
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its stderr explains why
+        finally:
+            encoder.stdin.close()
+            stderr = encoder.stderr.read()
+            encoder.wait()
+        
+        if encoder.returncode != 0 or num_frames is None:
+            raise RuntimeError(f"FFmpeg error: {stderr.decode(errors='replace')}")
+        
+        return num_frames / FPS
+    
+    def generate_lipsync_track(self, avatar_id: str, audio_path: str) -> Dict[str, Any]:
+        """Render lip sync straight into live WebRTC tracks instead of an MP4 file.
+        
+        Returns {"video": MuseTalkVideoTrack, "audio": audio track} ready for addTrack().
+        """
+        if not AIORTC_AVAILABLE:
+            raise RuntimeError("aiortc is required for WebRTC streaming")
+        
+        avatar_info = self._get_avatar(avatar_id)
+        if avatar_info is None:
+            raise ValueError(f"Avatar {avatar_id} not prepared")
+        material = self._load_avatar_material(avatar_id)
+        if material is None or not self._load_inference_models():
+            raise RuntimeError(f"MuseTalk inference unavailable for avatar {avatar_id}")
+        
+        video_track = MuseTalkVideoTrack()
+        
+        def render():
+            try:
+                self._render_frames(avatar_id, audio_path, material, video_track.push)
+            except Exception as e:
+                logger.error(f"Live lip sync render failed: {e}")
+            finally:
+                video_track.push(None)
+        
+        threading.Thread(target=render, daemon=True).start()
+        return {"video": video_track, "audio": MediaPlayer(audio_path).audio}
+    
+    def _get_avatar_nv12(self, avatar_id: str, avatar_info: Dict[str, Any]):
+        """NV12 frame of the avatar still, built from the prepared raw I420 frame and kept in memory"""
+        if avatar_id in self.avatar_nv12:
+            return self.avatar_nv12[avatar_id]
+        
+        raw_frame = avatar_info.get('raw_frame')
+        if raw_frame and os.path.exists(raw_frame['path']):
+            width, height = raw_frame['width'], raw_frame['height']
+            planes = np.fromfile(raw_frame['path'], dtype=np.uint8)
+        else:
+            # Avatars prepared before the raw frame existed: decode the PNG once
+            frame = cv2.imread(avatar_info['image_path'])
+            # NV12 needs even dimensions
+            height, width = frame.shape[0] & ~1, frame.shape[1] & ~1
+            planes = cv2.cvtColor(frame[:height, :width], cv2.COLOR_BGR2YUV_I420).reshape(-1)
+        
+        # Planar I420 -> NV12 (interleaved UV plane)
+        luma_size, chroma_size = height * width, height * width // 4
+        uv = np.empty(2 * chroma_size, dtype=np.uint8)
+        uv[0::2] = planes[luma_size:luma_size + chroma_size]
+        uv[1::2] = planes[luma_size + chroma_size:]
+        nv12 = np.concatenate([planes[:luma_size], uv]).reshape(height * 3 // 2, width)
+        
+        self.avatar_nv12[avatar_id] = nv12
+        return nv12
+    
+    def _encode_static_video_nvc(self, nv12, audio_path: str, output_path: str, duration: float) -> bool:
+        """Encode the still avatar NV12 frame with PyNvVideoCodec; ffmpeg only muxes in the audio"""
+        height, width = nv12.shape[0] * 2 // 3, nv12.shape[1]
+        # The bindings take encoder options as strings; older releases reject ints
+        encoder = pnvc.CreateEncoder(width, height, "NV12", True, codec="h264", preset="P4",
+                                     tuning_info="low_latency", gop="120", fps=str(FPS))
+        num_frames = max(1, int(round(duration * FPS)))
+        
+        with tempfile.NamedTemporaryFile(suffix='.h264', delete=False) as bitstream:
+            bitstream_path = bitstream.name
+            for _ in range(num_frames):
+                bitstream.write(bytearray(encoder.Encode(nv12)))
+            bitstream.write(bytearray(encoder.EndEncode()))
+        
+        try:
+            result = subprocess.run([
+                'ffmpeg', '-y',
+                '-r', str(FPS), '-i', bitstream_path,
+                '-i', audio_path,
+                '-c:v', 'copy',
+                '-c:a', 'aac', '-b:a', '192k',
+                '-shortest',
+                output_path
+            ], capture_output=True, text=True)
+        finally:
+            os.unlink(bitstream_path)
+        
+        if result.returncode != 0:
+            logger.error(f"FFmpeg mux error: {result.stderr}")
+            return False
+        return True
+    
     def generate_lipsync_video(self, avatar_id: str, audio_path: str, output_path: str) -> Dict[str, Any]:
         """Generate lip-synced video for avatar with audio"""
         try:
-            if avatar_id not in self.avatars:
+            avatar_info = self._get_avatar(avatar_id)
+            if avatar_info is None:
                 return {"success": False, "error": f"Avatar {avatar_id} not prepared"}
                 
             logger.info(f"Generating lip sync video for {avatar_id}")
             
-            avatar_info = self.avatars[avatar_id]
-            avatar_dir = os.path.join(self.results_dir, 'avatars', avatar_id)
+            material = self._load_avatar_material(avatar_id)
             
-            # For demonstration, create a simple video with the avatar image
-            # In full implementation, this would use MuseTalk's real-time inference
+            if material is not None and self._load_inference_models():
+                duration = self._render_lipsync_video(avatar_id, audio_path, output_path, material)
+                return {
+                    "success": True,
+                    "video_path": output_path,
+                    "duration": duration,
+                    "face_detected": True,
+                    "method": "musetalk_realtime"
+                }
             
-            # Get audio duration
-            result = subprocess.run([
-                'ffprobe', '-v', 'quiet', '-show_entries', 
-                'format=duration', '-of', 'csv=p=0', audio_path
-            ], capture_output=True, text=True)
+            # Without face material or models, fall back to a static avatar video
             
+            # Get audio duration from the file header in-process
             try:
-                duration = float(result.stdout.strip())
-            except:
+                duration = sf.info(audio_path).duration
+            except Exception:
                 duration = 5.0  # Default duration
+            
+            if PYNVC_AVAILABLE and torch.cuda.is_available():
+                try:
+                    nv12 = self._get_avatar_nv12(avatar_id, avatar_info)
+                    if self._encode_static_video_nvc(nv12, audio_path, output_path, duration):
+                        return {
+                            "success": True,
+                            "video_path": output_path,
+                            "duration": duration,
+                            "face_detected": material is not None,
+                            "method": "placeholder_static"
+                        }
+                except Exception:
+                    logger.exception("PyNvVideoCodec encode failed, falling back to ffmpeg")
                 
             # Create video from static image with audio
-            # This is a placeholder - real MuseTalk would generate animated frames
+            raw_frame = avatar_info.get('raw_frame')
+            if raw_frame:
+                image_input = [
+                    '-f', 'rawvideo', '-pix_fmt', 'yuv420p',
+                    '-s', f"{raw_frame['width']}x{raw_frame['height']}", '-r', str(FPS),
+                    '-stream_loop', '-1', '-i', raw_frame['path']
+                ]
+                frame_rate_args = []
+            else:
+                image_input = ['-loop', '1', '-i', avatar_info['image_path']]
+                frame_rate_args = ['-vf', f'fps={FPS}']
             cmd = [
                 'ffmpeg', '-y',
-                '-loop', '1', '-i', avatar_info['image_path'],
+                *image_input,
                 '-i', audio_path,
-                '-c:v', 'libx264', '-tune', 'stillimage',
+                *_video_encoder_args(),
+                *frame_rate_args, '-threads', '0',
                 '-c:a', 'aac', '-b:a', '192k',
                 '-pix_fmt', 'yuv420p',
                 '-shortest',
@@ -195,27 +965,73 @@ class MuseTalkLipSync:
                 logger.error(f"FFmpeg error: {result.stderr}")
                 return {"success": False, "error": "Video generation failed"}
                 
-            # In real implementation, this would be the actual MuseTalk processing:
-            # 1. Extract audio features using Whisper
-            # 2. Generate lip sync frames using UNet model
-            # 3. Blend frames with original avatar
-            # 4. Encode final video
-                
             return {
                 "success": True,
                 "video_path": output_path,
                 "duration": duration,
-                "method": "placeholder_static"  # Would be "musetalk_realtime" in full implementation
+                "face_detected": material is not None,
+                "method": "placeholder_static"
             }
             
         except Exception as e:
             logger.error(f"Video generation failed: {e}")
             return {"success": False, "error": str(e)}
 
+def serve(service: MuseTalkLipSync):
+    """Answer one JSON job per stdin line with one JSON result per stdout line"""
+    # MuseTalk and its dependencies print progress chatter; keep stdout for the protocol only
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    reply_lock = threading.Lock()
+    
+    def reply(message):
+        with reply_lock:
+            protocol_out.write(json.dumps(message) + "\n")
+            protocol_out.flush()
+    
+    def handle(job):
+        job_id = job.get("id")
+        try:
+            command = job.get("command")
+            if command == "init":
+                result = {"success": service.initialize_models()}
+            elif command == "prepare":
+                result = service.prepare_avatar(job["image_path"], job["avatar_id"])
+            elif command == "generate":
+                result = service.generate_lipsync_video(job["avatar_id"], job["audio_path"], job["output_path"])
+            elif command == "status":
+                result = {
+                    "success": True,
+                    "initialized": service.initialized,
+                    "modelsAvailable": service.models_loaded,
+                    "device": str(service.models['device']) if 'device' in service.models else 'unknown',
+                    "avatarsPrepared": len(service.avatars)
+                }
+            else:
+                result = {"success": False, "error": f"Unknown command: {command}"}
+            reply({"id": job_id, **result})
+        except Exception as e:
+            reply({"id": job_id, "success": False, "error": str(e)})
+    
+    reply({"ready": True})
+    
+    # Jobs run concurrently so simultaneous renders can share UNet batches
+    with ThreadPoolExecutor(max_workers=MAX_COALESCED_RENDERS) as executor:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                reply({"id": None, "success": False, "error": f"Invalid job: {e}"})
+                continue
+            executor.submit(handle, job)
+
 def main():
     """CLI interface for MuseTalk service"""
     parser = argparse.ArgumentParser(description='MuseTalk Lip Sync Service')
-    parser.add_argument('command', choices=['init', 'prepare', 'generate'])
+    parser.add_argument('command', choices=['init', 'prepare', 'generate', 'serve'])
     parser.add_argument('--avatar-id', help='Avatar identifier')
     parser.add_argument('--image-path', help='Path to avatar image')
     parser.add_argument('--audio-path', help='Path to audio file')
@@ -225,7 +1041,10 @@ def main():
     
     service = MuseTalkLipSync()
     
-    if args.command == 'init':
+    if args.command == 'serve':
+        serve(service)
+        
+    elif args.command == 'init':
         result = service.initialize_models()
         print(json.dumps({"success": result}))
         
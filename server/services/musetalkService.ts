@@ -1,9 +1,10 @@
-import { exec } from 'child_process';
+import { exec, spawn, type ChildProcessWithoutNullStreams } from 'child_process';
 import { promisify } from 'util';
 import path from 'path';
 import fs from 'fs/promises';
 import { fileURLToPath } from 'url';
 import { dirname } from 'path';
+import { createHash } from 'crypto';
 import { BattleCharacter } from '../../shared/characters';
 
 const __filename = fileURLToPath(import.meta.url);
@@ -26,6 +27,12 @@ export interface AvatarPrepResult {
   info?: any;
 }
 
+interface PendingMuseTalkJob {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
 /**
  * MuseTalk Integration Service
  * Provides real-time lip sync video generation for rap battle characters
@@ -35,10 +42,127 @@ export class MuseTalkService {
   private servicePath: string;
   private initialized = false;
   private preparedAvatars = new Set<string>();
+  // Identical avatar+audio requests that arrive while one is rendering share its result
+  private inflight = new Map<string, Promise<MuseTalkResult>>();
+  private videoEncoderArgs: Promise<string[]> | null = null;
+  private worker: ChildProcessWithoutNullStreams | null = null;
+  private workerBuffer = '';
+  private pendingJobs = new Map<number, PendingMuseTalkJob>();
+  private nextJobId = 0;
 
   constructor() {
     this.pythonPath = 'python3'; // Could be configured based on environment
-    this.servicePath = path.join(__dirname, 'musetalk_integration.py');
+    this.servicePath = path.join(__dirname, 'musetalk.py');
+
+    // Don't leave the worker (and its GPU memory) behind when the server stops
+    process.once('exit', () => this.worker?.kill());
+  }
+
+  /**
+   * Start the persistent MuseTalk worker if it is not already running.
+   * Models stay loaded in the worker, so only the first request pays for
+   * interpreter startup, CUDA init and weight loading.
+   */
+  private ensureWorker(): ChildProcessWithoutNullStreams {
+    if (this.worker) return this.worker;
+
+    const worker = spawn(this.pythonPath, ['-u', this.servicePath, 'serve']);
+    worker.stdout.setEncoding('utf8');
+    worker.stderr.setEncoding('utf8');
+
+    worker.stdout.on('data', (chunk: string) => {
+      // Ignore late output from a worker that was already replaced
+      if (this.worker !== worker) return;
+      this.workerBuffer += chunk;
+      let newline: number;
+      while ((newline = this.workerBuffer.indexOf('\n')) !== -1) {
+        const line = this.workerBuffer.slice(0, newline).trim();
+        this.workerBuffer = this.workerBuffer.slice(newline + 1);
+        if (line) this.handleWorkerMessage(line);
+      }
+    });
+
+    worker.stderr.on('data', (chunk: string) => {
+      if (!chunk.includes('Warning') && !chunk.includes('UserWarning')) {
+        console.error('MuseTalk worker stderr:', chunk.trim());
+      }
+    });
+
+    worker.on('error', (error) => console.error('MuseTalk worker error:', error));
+    worker.stdin.on('error', (error) => console.error('MuseTalk worker stdin error:', error));
+
+    worker.on('exit', (code) => {
+      console.warn(`MuseTalk worker exited (code ${code})`);
+      if (this.worker === worker) this.dropWorker('MuseTalk worker exited');
+    });
+
+    this.worker = worker;
+    return worker;
+  }
+
+  /**
+   * Forget the current worker and fail every job sent to it; the next job spawns a fresh one
+   */
+  private dropWorker(reason: string): void {
+    this.worker = null;
+    this.workerBuffer = '';
+    // Prepared avatars are cached on disk, but the worker's in-memory view is gone
+    this.preparedAvatars.clear();
+    this.pendingJobs.forEach(({ reject, timer }) => {
+      clearTimeout(timer);
+      reject(new Error(reason));
+    });
+    this.pendingJobs.clear();
+  }
+
+  /**
+   * Route a JSON result line from the worker to the request waiting on it
+   */
+  private handleWorkerMessage(line: string): void {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch {
+      console.log('MuseTalk worker output:', line);
+      return;
+    }
+
+    if (message.ready) {
+      console.log('MuseTalk worker ready');
+      return;
+    }
+
+    const pending = this.pendingJobs.get(message.id);
+    if (!pending) return;
+
+    this.pendingJobs.delete(message.id);
+    clearTimeout(pending.timer);
+    pending.resolve(message);
+  }
+
+  /**
+   * Send a job to the worker and wait for its result
+   */
+  private runWorkerJob(command: string, args: Record<string, unknown>, timeoutMs: number): Promise<any> {
+    const worker = this.ensureWorker();
+    const id = ++this.nextJobId;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pendingJobs.delete(id);
+        reject(new Error(`MuseTalk ${command} timeout`));
+        // A hung render holds the worker and its GPU; restart it rather than queue every later job behind it.
+        // A slow status poll only means the pool is busy, so it never restarts the worker.
+        if (command !== 'status' && this.worker === worker) {
+          console.warn(`MuseTalk ${command} timed out - restarting worker`);
+          this.dropWorker('MuseTalk worker restarted after a timeout');
+          worker.kill('SIGKILL');
+        }
+      }, timeoutMs);
+
+      this.pendingJobs.set(id, { resolve, reject, timer });
+      worker.stdin.write(JSON.stringify({ id, command, ...args }) + '\n');
+    });
   }
 
   /**
@@ -48,16 +172,16 @@ export class MuseTalkService {
     try {
       console.log('Initializing MuseTalk service...');
       
-      const { stdout, stderr } = await execAsync(`${this.pythonPath} ${this.servicePath} --initialize`);
+      const result = await this.runWorkerJob('init', {}, 120000);
       
       // Check if initialization was successful
-      if (stdout.includes('SUCCESS')) {
+      if (result.success) {
         this.initialized = true;
         console.log('MuseTalk service initialized successfully');
       } else {
         this.initialized = false;
         console.warn('MuseTalk service initialization failed - running in fallback mode');
-        if (stderr) console.warn('Initialization error:', stderr);
+        if (result.error) console.warn('Initialization error:', result.error);
       }
       
       return this.initialized;
@@ -90,15 +214,13 @@ export class MuseTalkService {
 
       console.log(`Preparing MuseTalk avatar for ${character.displayName} (${avatarId})`);
 
-      const { stdout } = await execAsync(
-        `${this.pythonPath} ${this.servicePath} --prepare-avatar "${avatarId}" "${imagePath}"`
-      );
+      const response = await this.runWorkerJob('prepare', { avatar_id: avatarId, image_path: imagePath }, 120000);
 
-      // Check for success message in stdout
       const result: AvatarPrepResult = {
-        success: stdout.includes('SUCCESS'),
+        success: Boolean(response.success),
         avatarId,
-        error: stdout.includes('FAILED') ? 'Avatar preparation failed' : undefined
+        info: response.info,
+        error: response.success ? undefined : response.error || 'Avatar preparation failed'
       };
       
       if (result.success) {
@@ -125,6 +247,38 @@ export class MuseTalkService {
     character: BattleCharacter,
     audioPath: string,
     outputPath: string
+  ): Promise<MuseTalkResult> {
+    let audioHash: string;
+    try {
+      audioHash = createHash('sha256').update(await fs.readFile(audioPath)).digest('hex');
+    } catch {
+      return { success: false, error: `Audio file not found: ${audioPath}` };
+    }
+
+    const key = `${character.id}:${audioHash}`;
+    const existing = this.inflight.get(key);
+    if (existing) {
+      console.log(`Joining in-flight MuseTalk render for ${character.displayName}`);
+      const result = await existing;
+      if (!result.success || !result.videoPath || result.videoPath === outputPath) return result;
+      // The shared render went to the first caller's path; give this caller its own copy
+      await fs.copyFile(result.videoPath, outputPath);
+      return { ...result, videoPath: outputPath };
+    }
+
+    const generation = this.doGenerateLipSyncVideo(character, audioPath, outputPath);
+    this.inflight.set(key, generation);
+    try {
+      return await generation;
+    } finally {
+      this.inflight.delete(key);
+    }
+  }
+
+  private async doGenerateLipSyncVideo(
+    character: BattleCharacter,
+    audioPath: string,
+    outputPath: string
   ): Promise<MuseTalkResult> {
     try {
       const avatarId = character.id;
@@ -146,16 +300,16 @@ export class MuseTalkService {
 
       console.log(`Generating MuseTalk lip sync video for ${character.displayName}`);
 
-      const { stdout } = await execAsync(
-        `${this.pythonPath} ${this.servicePath} --generate "${avatarId}" "${audioPath}" "${outputPath}"`
+      const response = await this.runWorkerJob(
+        'generate', { avatar_id: avatarId, audio_path: audioPath, output_path: outputPath }, 300000
       );
 
-      // Check for success message in stdout
       const result: MuseTalkResult = {
-        success: stdout.includes('SUCCESS'),
-        videoPath: stdout.includes('SUCCESS') ? outputPath : undefined,
-        error: stdout.includes('FAILED') ? 'Video generation failed' : undefined,
-        method: 'MuseTalk'
+        success: Boolean(response.success),
+        videoPath: response.success ? response.video_path : undefined,
+        duration: response.duration,
+        error: response.success ? undefined : response.error || 'Video generation failed',
+        method: response.method || 'MuseTalk'
       };
       
       if (result.success) {
@@ -185,11 +339,25 @@ export class MuseTalkService {
    * Get detailed status of MuseTalk service
    */
   async getStatus() {
+    // A status poll must not cold-start the torch worker; report what is known locally until one runs
+    if (!this.worker) {
+      return {
+        initialized: this.initialized,
+        modelsAvailable: false,
+        device: 'unknown',
+        avatarsPrepared: this.preparedAvatars.size,
+        workerRunning: false,
+        preparedAvatars: Array.from(this.preparedAvatars),
+        pythonPath: this.pythonPath,
+        servicePath: this.servicePath
+      };
+    }
+
     try {
-      const { stdout } = await execAsync(`${this.pythonPath} ${this.servicePath} --status`);
-      const status = JSON.parse(stdout);
+      const { id, success, ...status } = await this.runWorkerJob('status', {}, 10000);
       return {
         ...status,
+        workerRunning: true,
         preparedAvatars: Array.from(this.preparedAvatars),
         pythonPath: this.pythonPath,
         servicePath: this.servicePath
@@ -208,6 +376,28 @@ export class MuseTalkService {
     }
   }
 
+  /**
+   * Pick the H.264 encoder once: NVENC when an NVIDIA GPU and an NVENC-enabled ffmpeg are present
+   */
+  private getVideoEncoderArgs(): Promise<string[]> {
+    if (!this.videoEncoderArgs) {
+      this.videoEncoderArgs = (async () => {
+        try {
+          await fs.access('/proc/driver/nvidia/version');
+          const { stdout } = await execAsync('ffmpeg -hide_banner -encoders', { timeout: 5000 });
+          if (stdout.includes('h264_nvenc')) {
+            console.log('Using NVENC for fallback videos');
+            return ['-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll'];
+          }
+        } catch {
+          // No GPU driver or ffmpeg probe failed - use the CPU encoder
+        }
+        return ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'stillimage'];
+      })();
+    }
+    return this.videoEncoderArgs;
+  }
+
   /**
    * Create a fallback static video when MuseTalk is not available
    */
@@ -228,7 +418,7 @@ export class MuseTalkService {
         'ffmpeg', '-y',
         '-loop', '1', '-i', `"${imagePath}"`,
         '-i', `"${audioPath}"`,
-        '-c:v', 'libx264', '-tune', 'stillimage',
+        ...(await this.getVideoEncoderArgs()),
         '-c:a', 'aac', '-b:a', '192k',
         '-pix_fmt', 'yuv420p',
         '-shortest',
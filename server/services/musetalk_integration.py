@@ -9,31 +9,36 @@ import sys
 import json
 import logging
 import subprocess
-import shlex
 import argparse
-import glob
+import asyncio
+import shutil
+import functools
+import importlib.util
+import hashlib
+import uuid
+import tempfile
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, AsyncIterator, Union
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Check for basic dependencies
-BASIC_DEPS = True  # Assume basic deps are available in the system
-try:
-    import numpy as np
-    logger.info("NumPy available for MuseTalk processing")
-except ImportError:
-    BASIC_DEPS = False
+@functools.lru_cache(maxsize=None)
+def _detect_basic_deps() -> bool:
+    """Check for basic dependencies"""
+    if importlib.util.find_spec("numpy") is not None:
+        logger.info("NumPy available for MuseTalk processing")
+        return True
     logger.warning("NumPy not available - some features may be limited")
+    return False
 
-# Check for MuseTalk full installation
-MUSETALK_AVAILABLE = False
-try:
-    # Check if MuseTalk directory exists and has required structure
-    musetalk_path = Path("MuseTalk")
-    if musetalk_path.exists():
+@functools.lru_cache(maxsize=None)
+def _detect_musetalk() -> bool:
+    """Check for MuseTalk full installation"""
+    try:
+        # Check if MuseTalk directory exists and has required structure
+        musetalk_path = Path("MuseTalk")
+        if not musetalk_path.exists():
+            return False
         sys.path.insert(0, str(musetalk_path))
         # Check for key model files
         required_files = [
@@ -42,13 +47,193 @@ try:
         ]
         
         if all(f.exists() for f in required_files):
-            MUSETALK_AVAILABLE = True
             logger.info("MuseTalk installation detected with model files")
+            return True
+        logger.info("MuseTalk directory found but missing required model files")
+        return False
+    except Exception as e:
+        logger.info(f"MuseTalk full installation check failed: {e}")
+        return False
+
+# Probes run on first use and are cached, so importing the module does no I/O
+@functools.lru_cache(maxsize=None)
+def _detect_ffmpeg() -> bool:
+    """Check if FFmpeg is on PATH"""
+    return shutil.which("ffmpeg") is not None
+
+@functools.lru_cache(maxsize=None)
+def _musetalk_ffmpeg_extra() -> str:
+    """Encoder flags for inference.py's frame encode: NVENC when a GPU and an NVENC ffmpeg exist, else all cores"""
+    if "MUSETALK_FFMPEG_EXTRA" in os.environ:
+        return os.environ["MUSETALK_FFMPEG_EXTRA"]
+    nvenc = False
+    if _detect_ffmpeg() and os.path.exists("/proc/driver/nvidia/version"):
+        try:
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=5)
+            nvenc = "h264_nvenc" in result.stdout
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+    return "-threads 0 -c:v h264_nvenc -preset p4 -tune ll" if nvenc else "-threads 0"
+
+@functools.lru_cache(maxsize=None)
+def _probe_ffmpeg() -> bool:
+    """Check that FFmpeg actually runs, not just that it is on PATH"""
+    if not _detect_ffmpeg():
+        return False
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, timeout=2)
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+# Weights needed for full mode, relative to the models directory
+MODEL_FILES = [
+    "musetalkV15/unet.pth",
+    "musetalkV15/musetalk.json",
+    "dwpose/dw-ll_ucoco_384.pth",
+    "face-parse-bisent/79999_iter.pth"
+]
+
+# Face-crop settings passed to inference.py; they change the preprocessing output, so they are part of the cache key
+PREPROCESS_PARAMS = {
+    "bbox_shift": 0,
+    "extra_margin": 10,
+    "parsing_mode": "jaw",
+    "left_cheek_width": 90,
+    "right_cheek_width": 90,
+    "version": "v15"
+}
+
+class AvatarCache:
+    """On-disk MuseTalk preprocessing (face coords, VAE latents, blend masks) keyed by avatar content"""
+    
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+    
+    def entry_dir(self, image_path: str, params: Dict[str, Any]) -> Path:
+        """Cache directory for this image and parameter set, counting whether it is already populated"""
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        
+        entry = self.cache_dir / digest.hexdigest()
+        if (entry / "preprocess.json").exists():
+            self.hits += 1
         else:
-            logger.info("MuseTalk directory found but missing required model files")
-except Exception as e:
-    MUSETALK_AVAILABLE = False
-    logger.info(f"MuseTalk full installation check failed: {e}")
+            self.misses += 1
+        return entry
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "dir": str(self.cache_dir),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+INFERENCE_SCRIPT = "MuseTalk/scripts/inference.py"
+BARK_LAUNCHER = "run_bark.sh"
+# Seconds to wait for a worker to load its models, and for one generation
+WORKER_START_TIMEOUT = 300
+GENERATION_TIMEOUT = 300
+# Concurrent generations arriving within the wait window are sent to the worker as one batch job
+MUSETALK_BATCH_SIZE = int(os.environ.get("MUSETALK_BATCH_SIZE", "4"))
+MUSETALK_BATCH_WAIT_MS = float(os.environ.get("MUSETALK_BATCH_WAIT_MS", "50"))
+# Worker processes that may run batches at the same time (each holds its own copy of the models),
+# assigned round-robin to the listed GPUs
+MUSETALK_MAX_CONCURRENT = max(1, int(os.environ.get("MUSETALK_MAX_CONCURRENT", "1")))
+MUSETALK_GPU_IDS = os.environ.get("MUSETALK_GPU_IDS", "0").split(",")
+# Read size for fragmented MP4 streamed out of the worker's FIFO
+VIDEO_STREAM_CHUNK = 1 << 16
+
+class ServeWorker:
+    """Long-lived JSON-lines worker (`inference.py --serve`, `run_bark.sh --serve`) that keeps its models loaded"""
+    
+    def __init__(self, command: list, name: str, env=None):
+        self.command = command
+        self.name = name
+        # Optional callable returning extra environment variables, evaluated at each (re)spawn
+        self.env = env
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.lock: Optional[asyncio.Lock] = None
+        self.next_id = 0
+    
+    async def _ensure_started(self) -> None:
+        """Spawn the worker on first use, or respawn it if it died, and wait for its ready line"""
+        if self.process is not None and self.process.returncode is None:
+            return
+        if self.process is not None:
+            logger.warning(f"{self.name} worker exited with code {self.process.returncode}, respawning")
+        
+        # stderr is inherited so inference progress shows up in the server log
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            env={**os.environ, **self.env()} if self.env else None
+        )
+        try:
+            message = await asyncio.wait_for(self._read_message(), timeout=WORKER_START_TIMEOUT)
+        except Exception:
+            await self.stop()
+            raise
+        if not message.get("ready"):
+            await self.stop()
+            raise RuntimeError(f"Unexpected {self.name} worker greeting: {message}")
+        logger.info(f"{self.name} worker ready")
+    
+    async def _read_message(self) -> Dict[str, Any]:
+        """Next JSON line from the worker, skipping anything printed before it took over stdout"""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"{self.name} worker exited")
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+    
+    async def request(self, payload: Dict[str, Any], timeout: float = GENERATION_TIMEOUT) -> Dict[str, Any]:
+        """Run one job on the worker and return its reply"""
+        message = None
+        async for message in self.stream(payload, timeout):
+            pass
+        return message
+    
+    async def stream(self, payload: Dict[str, Any], timeout: float = GENERATION_TIMEOUT):
+        """Run one job and yield its replies until the final one (with "success") arrives.
+        
+        Jobs are serialized since they share one model context; timeout applies per reply.
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            await self._ensure_started()
+            self.next_id += 1
+            job_id = self.next_id
+            self.process.stdin.write((json.dumps({"id": job_id, **payload}) + "\n").encode())
+            await self.process.stdin.drain()
+            try:
+                while True:
+                    message = await asyncio.wait_for(self._read_message(), timeout=timeout)
+                    if message.get("id") != job_id:
+                        continue
+                    yield message
+                    if "success" in message:
+                        return
+            except asyncio.TimeoutError:
+                # The worker is still busy with this job; replace it rather than queue behind it
+                await self.stop()
+                raise
+    
+    async def stop(self) -> None:
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
 
 class MuseTalkIntegration:
     """MuseTalk integration with fallback simulation for rap battle avatars"""
@@ -56,42 +241,111 @@ class MuseTalkIntegration:
     def __init__(self, models_dir: str = "MuseTalk/models"):
         self.models_dir = Path(models_dir)
         self.is_initialized = False
-        self.simulation_mode = not MUSETALK_AVAILABLE
+        self.simulation_mode = not _detect_musetalk()
+        # (directory mtimes, missing files) from the last weights scan
+        self._weights_cache: Optional[Tuple[tuple, list]] = None
+        self._requirements: Optional[Dict[str, bool]] = None
+        self.avatar_cache = AvatarCache(Path("results") / "musetalk" / "avatar_cache")
+        # Started on the first full-mode generation; settings shared by every job are fixed at launch
+        self.workers = [
+            ServeWorker(
+                [sys.executable, INFERENCE_SCRIPT, "--serve", "--fps", "25", "--batch_size", "1", "--use_float16",
+                 "--gpu_id", MUSETALK_GPU_IDS[i % len(MUSETALK_GPU_IDS)]] +
+                [arg for name, value in PREPROCESS_PARAMS.items() for arg in (f"--{name}", str(value))],
+                f"MuseTalk-{i}",
+                env=lambda: {"MUSETALK_FFMPEG_EXTRA": _musetalk_ffmpeg_extra()}
+            )
+            for i in range(MUSETALK_MAX_CONCURRENT)
+        ]
+        # Only used for streaming text-to-video; started on the first streamed verse
+        self.bark_worker = ServeWorker(["bash", BARK_LAUNCHER, "--serve"], "Bark")
+        # Created inside the running event loop on the first full-mode generation
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._idle_workers: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
         
         # Configuration
         self.config = {
             "version": "v15",
             "fps": 25,
-            "simulation_mode": self.simulation_mode
+            "simulation_mode": self.simulation_mode,
+            "avatar_cache_dir": str(self.avatar_cache.cache_dir)
         }
         
         logger.info(f"MuseTalk integration mode: {'Simulation' if self.simulation_mode else 'Full'}")
         
-    def check_requirements(self) -> Dict[str, bool]:
-        """Check system requirements and dependencies"""
-        requirements = {
-            "python_version": sys.version_info >= (3, 8),
-            "ffmpeg": self._check_ffmpeg(),
-            "basic_deps": BASIC_DEPS,
-            "musetalk_full": MUSETALK_AVAILABLE,
-            "simulation_ready": True  # Always ready for simulation
-        }
+    def check_requirements(self, deep_check: bool = False) -> Dict[str, bool]:
+        """Check system requirements and dependencies; every probe is cached, so only the first call logs.
         
-        logger.info(f"Requirements check: {requirements}")
-        return requirements
+        deep_check runs ffmpeg once to confirm it works instead of only looking it up on PATH.
+        """
+        if self._requirements is None or deep_check:
+            self._requirements = {
+                "python_version": sys.version_info >= (3, 8),
+                "ffmpeg": self._check_ffmpeg(deep_check),
+                "basic_deps": _detect_basic_deps(),
+                "musetalk_full": _detect_musetalk(),
+                "simulation_ready": True  # Always ready for simulation
+            }
+            logger.info(f"Requirements check: {self._requirements}")
+        return dict(self._requirements)
     
-    def _check_ffmpeg(self) -> bool:
+    def _check_ffmpeg(self, deep_check: bool = False) -> bool:
         """Check if FFmpeg is available"""
-        try:
-            result = subprocess.run(['ffmpeg', '-version'], 
-                                  capture_output=True, text=True, timeout=5)
-            return result.returncode == 0
-        except:
-            return False
+        return _probe_ffmpeg() if deep_check else _detect_ffmpeg()
+    
+    def check_model_weights(self) -> bool:
+        """Check that all model weights are present, rescanning only when a weights directory changes"""
+        return not self._missing_model_weights()
+    
+    def _prefetch_model_weights(self):
+        """Ask the kernel to start reading the checkpoints so the worker's mmap loads hit the page cache"""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        for model_file in MODEL_FILES:
+            if not model_file.endswith(".pth"):
+                continue
+            try:
+                fd = os.open(self.models_dir / model_file, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+    
+    def _missing_model_weights(self) -> list:
+        weight_dirs = sorted({os.path.dirname(f) for f in MODEL_FILES})
+        mtimes = []
+        for weight_dir in weight_dirs:
+            try:
+                mtimes.append(os.stat(self.models_dir / weight_dir).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        mtimes = tuple(mtimes)
+        
+        # Adding or removing a file bumps its directory's mtime, so unchanged mtimes mean an unchanged result
+        if self._weights_cache is not None and self._weights_cache[0] == mtimes:
+            return self._weights_cache[1]
+        
+        present = set()
+        for weight_dir, mtime in zip(weight_dirs, mtimes):
+            if mtime is None:
+                continue
+            # One directory listing instead of a stat per file
+            with os.scandir(self.models_dir / weight_dir) as entries:
+                present.update(f"{weight_dir}/{entry.name}" for entry in entries)
+        
+        missing = [str(self.models_dir / f) for f in MODEL_FILES if f not in present]
+        self._weights_cache = (mtimes, missing)
+        return missing
     
     def initialize_models(self) -> bool:
         """Initialize MuseTalk system (full or simulation mode)"""
-        if not MUSETALK_AVAILABLE:
+        if not _detect_musetalk():
             logger.info("MuseTalk models not available - initializing simulation mode")
             self.simulation_mode = True
             self.is_initialized = True
@@ -100,21 +354,16 @@ class MuseTalkIntegration:
         try:
             logger.info("MuseTalk models detected - initializing full mode")
             
-            # Verify key model files exist
-            model_files = [
-                Path("MuseTalk/models/musetalkV15/unet.pth"),
-                Path("MuseTalk/models/musetalkV15/musetalk.json"), 
-                Path("MuseTalk/models/dwpose/dw-ll_ucoco_384.pth"),
-                Path("MuseTalk/models/face-parse-bisent/79999_iter.pth")
-            ]
-            
-            missing_files = [str(f) for f in model_files if not f.exists()]
+            # Verify key model files exist, always rescanning on (re)initialization
+            self._weights_cache = None
+            missing_files = self._missing_model_weights()
             if missing_files:
                 logger.warning(f"Missing model files: {missing_files}")
                 self.simulation_mode = True
             else:
                 logger.info("All required MuseTalk models found")
                 self.simulation_mode = False
+                self._prefetch_model_weights()
                 
             self.is_initialized = True
             mode_str = 'simulation' if self.simulation_mode else 'full'
@@ -133,8 +382,8 @@ class MuseTalkIntegration:
             self.is_initialized = True
             return True
     
-    def generate_lip_sync_video(self, audio_path: str, avatar_image_path: str, 
-                               character_id: str) -> Optional[str]:
+    async def generate_lip_sync_video(self, audio_path: str, avatar_image_path: str, 
+                                     character_id: str) -> Optional[str]:
         """
         Generate lip-synced video using MuseTalk (full or simulation mode)
         """
@@ -145,7 +394,112 @@ class MuseTalkIntegration:
         if self.simulation_mode:
             return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
         else:
-            return self._generate_full_musetalk_video(audio_path, avatar_image_path, character_id)
+            return await self._generate_full_musetalk_video(audio_path, avatar_image_path, character_id)
+    
+    async def _run_inference(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one inference task for the batcher and wait for its own result"""
+        if self._batcher is None or self._batcher.done():
+            self._batch_queue = asyncio.Queue()
+            # Idle workers bound how many batches run at once, like a semaphore that also picks the worker
+            self._idle_workers = asyncio.Queue()
+            for worker in self.workers:
+                self._idle_workers.put_nowait(worker)
+            self._batcher = asyncio.create_task(self._batcher_loop())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._batch_queue.put((task, future))
+        return await future
+    
+    async def _batcher_loop(self) -> None:
+        """Coalesce queued tasks into worker batch jobs so their frames share UNet forwards"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._batch_queue.get()]
+            # Tasks that arrive while every worker is busy join this batch
+            worker = await self._idle_workers.get()
+            deadline = loop.time() + MUSETALK_BATCH_WAIT_MS / 1000
+            while len(batch) < MUSETALK_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._batch_queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # The loop only keeps weak references to tasks
+            dispatch = asyncio.create_task(self._dispatch_batch(worker, batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch_batch(self, worker: ServeWorker, batch: list) -> None:
+        """Run one batch on a worker, resolve each caller's future, and hand the worker back"""
+        tasks = [task for task, _ in batch]
+        try:
+            if len(tasks) == 1:
+                results = [await worker.request(tasks[0])]
+            else:
+                logger.info(f"Batching {len(tasks)} MuseTalk generations on {worker.name}")
+                reply = await worker.request({"batch": tasks}, timeout=GENERATION_TIMEOUT * len(tasks))
+                results = reply["results"] if reply.get("success") else [reply] * len(tasks)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._idle_workers.put_nowait(worker)
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def generate_lip_sync_video_streaming(self, text: str, avatar_image_path: str,
+                                                character_id: str, voice: Optional[str] = None):
+        """
+        Synthesize text with Bark and lip-sync it piece by piece, yielding each segment as soon as
+        it is ready so playback can start while later lines are still being synthesized
+        """
+        if not self.is_initialized:
+            logger.error("MuseTalk not initialized")
+            return
+        
+        # Bark runs from its own directory, so hand it an absolute path
+        audio_dir = (Path("results") / "musetalk" / character_id / "stream" / uuid.uuid4().hex).resolve()
+        job = {"stream": True, "text": text, "output_dir": str(audio_dir)}
+        if voice:
+            job["voice"] = voice
+        
+        audio_chunks: asyncio.Queue = asyncio.Queue()
+        
+        async def synthesize():
+            try:
+                async for message in self.bark_worker.stream(job):
+                    if "audio_path" in message:
+                        await audio_chunks.put(message["audio_path"])
+                    elif not message.get("success"):
+                        logger.error(f"Bark streaming failed: {message.get('error')}")
+            except Exception as e:
+                logger.error(f"Bark streaming failed: {e}")
+            finally:
+                await audio_chunks.put(None)
+        
+        # Bark keeps synthesizing the next piece while MuseTalk renders the current one
+        producer = asyncio.create_task(synthesize())
+        try:
+            index = 0
+            while (audio_path := await audio_chunks.get()) is not None:
+                segment = await self.generate_lip_sync_video(audio_path, avatar_image_path,
+                                                             f"{character_id}_{index:03d}")
+                yield {
+                    "index": index,
+                    "audio_path": audio_path,
+                    "result": json.loads(segment) if segment else None
+                }
+                index += 1
+        finally:
+            if not producer.done():
+                producer.cancel()
     
     def _generate_simulation_video(self, audio_path: str, avatar_image_path: str, 
                                  character_id: str) -> Optional[str]:
@@ -169,9 +523,22 @@ class MuseTalkIntegration:
             logger.error(f"Simulation failed: {e}")
             return None
     
-    def _generate_full_musetalk_video(self, audio_path: str, avatar_image_path: str, 
-                                    character_id: str) -> Optional[str]:
-        """Generate full MuseTalk video (when models are available)"""
+    async def _generate_full_musetalk_video(self, audio_path: str, avatar_image_path: str, 
+                                          character_id: str, stream: bool = False
+                                          ) -> Union[Optional[str], AsyncIterator[bytes]]:
+        """
+        Generate full MuseTalk video (when models are available)
+        With stream=True, return an async iterator over the video as fragmented MP4 instead of a JSON path
+        """
+        if stream:
+            logger.info(f"Streaming full MuseTalk video for {character_id}")
+            cache_entry = self.avatar_cache.entry_dir(avatar_image_path, PREPROCESS_PARAMS)
+            return self._stream_fragmented_video({
+                "video_path": avatar_image_path,
+                "audio_path": audio_path,
+                "options": {"preprocess_cache": str(cache_entry)}
+            })
+        
         try:
             logger.info(f"Generating full MuseTalk video for {character_id}")
             
@@ -179,81 +546,120 @@ class MuseTalkIntegration:
             output_dir = Path("results") / "musetalk" / character_id
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Use command-line inference to avoid Python dependency issues
-            cmd = [
-                "python3", "MuseTalk/scripts/inference.py",
-                "--video_path", avatar_image_path,
-                "--audio_path", audio_path,
-                "--result_dir", str(output_dir),
-                "--fps", "25",
-                "--batch_size", "1",
-                "--output_vid_name", f"{character_id}_lipsync.mp4",
-                "--bbox_shift", "0",
-                "--extra_margin", "10",
-                "--parsing_mode", "jaw",
-                "--left_cheek_width", "90", 
-                "--right_cheek_width", "90",
-                "--use_float16",
-                "--version", "v15"
-            ]
+            # Reuse face detection, parsing and VAE encoding from earlier runs with the same avatar
+            cache_entry = self.avatar_cache.entry_dir(avatar_image_path, PREPROCESS_PARAMS)
+            
+            # inference.py writes <result_dir>/<version>/<output_vid_name>
+            video_name = f"{character_id}_lipsync.mp4"
+            expected_video = output_dir / PREPROCESS_PARAMS["version"] / video_name
             
-            logger.info(f"Running MuseTalk command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            # The warm worker runs the task, batched with any concurrent ones; only per-job paths are sent
+            result = await self._run_inference({
+                "video_path": avatar_image_path,
+                "audio_path": audio_path,
+                "options": {
+                    "result_dir": str(output_dir),
+                    "output_vid_name": video_name,
+                    "preprocess_cache": str(cache_entry)
+                }
+            })
+            
+            result_video = result.get("video_path") or str(expected_video)
+            if result.get("success") and not Path(result_video).is_file():
+                logger.error("MuseTalk completed but no video file found")
+                return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
             
-            if result.returncode == 0:
-                # Find the generated video file
-                output_pattern = str(output_dir / "*.mp4")
-                video_files = glob.glob(output_pattern)
+            if result.get("success"):
+                logger.info(f"MuseTalk video generated: {result_video}")
                 
-                if video_files:
-                    result_video = video_files[0]
-                    logger.info(f"MuseTalk video generated: {result_video}")
-                    
-                    # Return metadata about the generated video
-                    return json.dumps({
-                        "mode": "full",
-                        "video_path": result_video,
-                        "character_id": character_id,
-                        "success": True,
-                        "message": "Full MuseTalk video generation completed"
-                    })
-                else:
-                    logger.error("MuseTalk completed but no video file found")
-                    return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
+                # Return metadata about the generated video
+                return json.dumps({
+                    "mode": "full",
+                    "video_path": result_video,
+                    "character_id": character_id,
+                    "success": True,
+                    "message": "Full MuseTalk video generation completed"
+                })
             else:
-                logger.error(f"MuseTalk inference failed: {result.stderr}")
+                logger.error(f"MuseTalk inference failed: {result.get('error')}")
                 return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
                 
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             logger.error("MuseTalk inference timed out")
             return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
         except Exception as e:
             logger.error(f"Full MuseTalk generation failed: {e}")
             return self._generate_simulation_video(audio_path, avatar_image_path, character_id)
     
+    async def _stream_fragmented_video(self, task: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """Have the worker mux into a FIFO and yield the fragmented MP4 as ffmpeg writes it"""
+        fifo_dir = tempfile.mkdtemp(prefix="musetalk_")
+        fifo_path = os.path.join(fifo_dir, "video.mp4")
+        os.mkfifo(fifo_path)
+        # Intermediate frames go next to the FIFO and are removed with it
+        task["options"].update({"result_dir": fifo_dir, "output_vid_name": fifo_path, "fragmented": True})
+        
+        # Open the read end first (non-blocking) so the worker's ffmpeg never waits on us to show up
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        pipe = os.fdopen(os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK), "rb", buffering=0)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        
+        def release_reader(inference: asyncio.Task) -> None:
+            if not inference.cancelled():
+                inference.exception()  # retrieved here in case the consumer stopped early
+            # A task that failed before ffmpeg opened the FIFO would leave the reader waiting forever;
+            # connecting and dropping a writer delivers EOF instead
+            try:
+                os.close(os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        
+        inference = asyncio.create_task(self._run_inference(task))
+        inference.add_done_callback(release_reader)
+        try:
+            while chunk := await reader.read(VIDEO_STREAM_CHUNK):
+                yield chunk
+            result = await inference
+            if not result.get("success"):
+                raise RuntimeError(f"MuseTalk inference failed: {result.get('error')}")
+        finally:
+            # Closing the read end early makes ffmpeg fail with EPIPE, which ends the task
+            transport.close()
+            shutil.rmtree(fifo_dir, ignore_errors=True)
+    
     def get_status(self) -> Dict[str, Any]:
         """Get current MuseTalk system status"""
         return {
             "available": self.is_initialized,
             "mode": "simulation" if self.simulation_mode else "full",
             "requirements": self.check_requirements(),
+            "model_weights": self.check_model_weights(),
+            "avatar_cache": self.avatar_cache.stats(),
             "config": self.config
         }
 
 def main():
     """Main CLI interface"""
+    # Configure logging only when run as a script, not on import
+    logging.basicConfig(level=logging.INFO)
+    
     parser = argparse.ArgumentParser(description="MuseTalk Rap Battle Integration")
     parser.add_argument("--initialize", action="store_true", help="Initialize MuseTalk system")
     parser.add_argument("--check-status", action="store_true", help="Check system status")
     parser.add_argument("--generate", nargs=3, metavar=('AUDIO', 'IMAGE', 'CHARACTER'), 
                        help="Generate lip sync video")
+    parser.add_argument("--stream-video", action="store_true",
+                       help="With --generate in full mode, write the video to stdout as fragmented MP4")
+    parser.add_argument("--generate-stream", nargs=3, metavar=('TEXT', 'IMAGE', 'CHARACTER'),
+                       help="Synthesize text with Bark and print one JSON line per lip-synced segment")
     
     args = parser.parse_args()
     
     musetalk = MuseTalkIntegration()
     
     if args.initialize:
-        requirements = musetalk.check_requirements()
+        requirements = musetalk.check_requirements(deep_check=True)
         if all(requirements.values()):
             success = musetalk.initialize_models()
             result = {"initialized": success, "requirements": requirements}
@@ -274,9 +680,44 @@ def main():
         if not musetalk.is_initialized:
             musetalk.initialize_models()
             
-        result_video = musetalk.generate_lip_sync_video(audio_path, image_path, character_id)
-        result = {"video_path": result_video, "success": result_video is not None}
-        print(json.dumps(result))
+        stream_video = args.stream_video and musetalk.is_initialized and not musetalk.simulation_mode
+        
+        async def generate_once():
+            try:
+                if stream_video:
+                    # The caller pipes stdout straight into its HTTP response
+                    chunks = await musetalk._generate_full_musetalk_video(audio_path, image_path,
+                                                                          character_id, stream=True)
+                    async for chunk in chunks:
+                        sys.stdout.buffer.write(chunk)
+                        sys.stdout.buffer.flush()
+                    return None
+                return await musetalk.generate_lip_sync_video(audio_path, image_path, character_id)
+            finally:
+                # A one-shot CLI call has no later jobs to keep the worker warm for
+                for worker in musetalk.workers:
+                    await worker.stop()
+        
+        result_video = asyncio.run(generate_once())
+        if not stream_video:
+            result = {"video_path": result_video, "success": result_video is not None}
+            print(json.dumps(result))
+        
+    elif args.generate_stream:
+        text, image_path, character_id = args.generate_stream
+        if not musetalk.is_initialized:
+            musetalk.initialize_models()
+        
+        async def stream_once():
+            try:
+                async for segment in musetalk.generate_lip_sync_video_streaming(text, image_path, character_id):
+                    print(json.dumps(segment), flush=True)
+            finally:
+                for worker in musetalk.workers:
+                    await worker.stop()
+                await musetalk.bark_worker.stop()
+        
+        asyncio.run(stream_once())
         
     else:
         parser.print_help()
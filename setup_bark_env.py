@@ -20,13 +20,40 @@ def install_packages():
         'funcy'
     ]
     
+    pip_install = [sys.executable, '-m', 'pip', 'install', '--user',
+                   '--no-input', '--disable-pip-version-check', '--prefer-binary']
+    
+    # One pip run resolves all dependencies together instead of starting pip once per package
+    try:
+        print(f"Installing {', '.join(packages)}...")
+        subprocess.check_call([*pip_install, *packages])
+        print("✅ All packages installed successfully")
+        return
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Combined install failed: {e} - retrying one package at a time")
+    
     for package in packages:
         try:
             print(f"Installing {package}...")
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', package, '--user'])
+            subprocess.check_call([*pip_install, package])
             print(f"✅ {package} installed successfully")
         except subprocess.CalledProcessError as e:
             print(f"❌ Failed to install {package}: {e}")
+
+def install_bark():
+    """Install Bark as a package so scripts can import it without sys.path shims"""
+    # Bark's own pyproject.toml makes a checkout installable; its dependencies come from install_packages
+    if os.path.isdir('./bark'):
+        source = ['-e', './bark']
+    else:
+        source = ['git+https://github.com/suno-ai/bark.git']
+    try:
+        print("Installing Bark...")
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '--user', '--no-input',
+                               '--disable-pip-version-check', '--no-deps', *source])
+        print("✅ Bark installed successfully")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Failed to install Bark: {e}")
             
 def test_imports():
     try:
@@ -44,7 +71,6 @@ def test_imports():
         print("✅ transformers")
         
         # Test Bark
-        sys.path.insert(0, './bark')
         from bark import generate_audio, SAMPLE_RATE
         print("✅ Bark imports successfully!")
         
@@ -64,6 +90,7 @@ if __name__ == "__main__":
     
     print("Installing packages...")
     install_packages()
+    install_bark()
     
     # Test again
     if test_imports():
@@ -1,45 +1,32 @@
 #!/usr/bin/env python3
-"""Final Bark test - avoiding numpy conflicts"""
+"""Final Bark test - runs against the shared Bark service (python3 bark_service.py)"""
 import sys
 import os
 
-# Move to a clean directory first to avoid numpy source conflicts
-clean_dir = "/tmp/bark_test_clean"
-os.makedirs(clean_dir, exist_ok=True)
-os.chdir(clean_dir)
-
-# Add workspace bark to path
-workspace_bark = "/home/runner/workspace/bark"
-if workspace_bark not in sys.path:
-    sys.path.insert(0, workspace_bark)
+import bark_service
+from bark_utils import save_wav
 
 def test_bark_tts():
     try:
-        print("🐶 Testing Bark TTS from clean directory...")
-        
-        # Import required packages
-        import numpy as np
-        print(f"✅ numpy {np.__version__}")
-        
-        import torch
-        print(f"✅ torch {torch.__version__}")
+        print("🐶 Testing Bark TTS through the shared service...")
         
-        from bark import generate_audio, SAMPLE_RATE
-        print(f"✅ Bark available! Sample rate: {SAMPLE_RATE}")
+        status = bark_service.status()
+        print(f"✅ numpy {status['numpy']}")
+        print(f"✅ torch {status['torch']}")
+        print(f"✅ Bark available! Sample rate: {bark_service.SAMPLE_RATE}")
         
         # Test minimal generation
         print("Generating test rap audio...")
         text = "Yo, this is MC Test coming at you with Bark TTS!"
-        audio_array = generate_audio(text)
+        audio_array = bark_service.generate(text)
         
         print(f"✅ Audio generated: {len(audio_array)} samples")
-        print(f"Duration: {len(audio_array) / SAMPLE_RATE:.2f} seconds")
+        print(f"Duration: {len(audio_array) / bark_service.SAMPLE_RATE:.2f} seconds")
         
         # Save test file
-        from scipy.io.wavfile import write as write_wav
         output_file = "/home/runner/workspace/temp_audio/bark_test_success.wav"
         os.makedirs("/home/runner/workspace/temp_audio", exist_ok=True)
-        write_wav(output_file, SAMPLE_RATE, audio_array)
+        save_wav(output_file, audio_array)
         
         file_size = os.path.getsize(output_file)
         print(f"✅ Saved to: {output_file} ({file_size} bytes)")
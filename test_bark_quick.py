@@ -1,9 +1,6 @@
 #!/usr/bin/env python3
 """Quick Bark availability test"""
-import os
 import sys
-os.chdir('/tmp')
-sys.path.insert(0, '/home/runner/workspace/bark')
 
 try:
     import numpy as np
@@ -1,21 +1,14 @@
 #!/usr/bin/env python3
-"""Test fast Bark TTS generation"""
+"""Test fast Bark TTS generation (needs python3 bark_service.py running)"""
 import os
 import sys
 import time
-os.chdir('/tmp')
-sys.path.insert(0, '/home/runner/workspace/bark')
 
 try:
-    import torch
-    import numpy as np
-    from bark import generate_audio, SAMPLE_RATE
-    from scipy.io.wavfile import write as write_wav
-    
-    # CPU optimizations
-    torch.set_num_threads(2)  # Use fewer threads
-    os.environ["OMP_NUM_THREADS"] = "2"
+    import bark_service
+    from bark_utils import save_wav
     
+    # Thread limits are applied inside the service process
     print("🚀 Fast Bark Test")
     
     # Very short text for speed test
@@ -23,18 +16,17 @@ try:
     print(f"Generating: {text}")
     
     start_time = time.time()
-    audio = generate_audio(
+    audio = bark_service.generate(
         text,
         history_prompt="v2/en_speaker_0",  # Simple voice
         text_temp=0.5,  # Lower temperature
-        waveform_temp=0.5,
-        silent=True
+        waveform_temp=0.5
     )
     end_time = time.time()
     
     # Save test audio
     output_path = "/home/runner/workspace/fast_test.wav"
-    write_wav(output_path, SAMPLE_RATE, audio)
+    save_wav(output_path, audio)
     
     generation_time = end_time - start_time
     file_size = os.path.getsize(output_path)
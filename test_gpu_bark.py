@@ -1,26 +1,17 @@
 #!/usr/bin/env python3
-"""Test Bark TTS with GPU acceleration"""
+"""Test Bark TTS with GPU acceleration (needs python3 bark_service.py running)"""
 import os
 import sys
-os.chdir('/tmp')
-sys.path.insert(0, '/home/runner/workspace/bark')
 
 try:
-    import torch
-    import numpy as np
-    from bark import generate_audio, SAMPLE_RATE
-    from scipy.io.wavfile import write as write_wav
+    import bark_service
+    from bark_utils import save_wav
     
     print("=== GPU Test for Bark TTS ===")
-    print(f"CUDA available: {torch.cuda.is_available()}")
-    if torch.cuda.is_available():
-        print(f"GPU count: {torch.cuda.device_count()}")
-        print(f"GPU name: {torch.cuda.get_device_name(0)}")
-        print(f"GPU memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
-        
-        # Clear GPU memory
-        torch.cuda.empty_cache()
-        print("GPU cache cleared")
+    status = bark_service.status()
+    print(f"CUDA available: {status['cuda']}")
+    if status['cuda']:
+        print(f"GPU name: {status['device']}")
     
     # Test generation with GPU
     text = "Yo, testing GPU acceleration for rap battles!"
@@ -28,21 +19,20 @@ try:
     
     import time
     start_time = time.time()
-    audio = generate_audio(
+    audio = bark_service.generate(
         text,
         history_prompt="v2/en_speaker_6",
         text_temp=0.7,
-        waveform_temp=0.7,
-        silent=False
+        waveform_temp=0.7
     )
     end_time = time.time()
     
     # Save audio
     output_path = "/home/runner/workspace/gpu_test_audio.wav"
-    write_wav(output_path, SAMPLE_RATE, audio)
+    save_wav(output_path, audio)
     
     file_size = os.path.getsize(output_path)
-    duration = len(audio) / SAMPLE_RATE
+    duration = len(audio) / bark_service.SAMPLE_RATE
     generation_time = end_time - start_time
     
     print(f"\n✅ GPU Test Results:")